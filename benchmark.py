@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import isingsim
+import kernels
+
+SIZES = [10, 32, 100, 316, 1024]  # Lattice sides benchmarked by default
+HERBIVORES = [1, 10, 100, 1000, 10000]  # Herbivore counts benchmarked by default (herbivore-dependent cases only)
+BATCH = 1000  # Calls per timed batch for the cheap single-cell operations
+
+
+def bench_flip(sim):
+    """BATCH random-site flips"""
+    for _ in range(BATCH):
+        sim.flip()
+    return BATCH
+
+
+def bench_potential(sim):
+    """BATCH energy differences at random cells"""
+    for cell in sim.cell_picks.take(BATCH):
+        sim.potential(cell)
+    return BATCH
+
+
+def bench_get_total(sim):
+    """One total energy calculation"""
+    sim.get_total()
+    return 1
+
+
+def bench_herbivory(sim):
+    """One herbivory step for the whole swarm"""
+    sim.herbivory(sim.TIME_STEP)
+    return 1
+
+
+def bench_init_grid(sim):
+    """One rebuild of the starting lattice"""
+    sim.init_grid()
+    return 1
+
+
+def bench_step(sim):
+    """Full headless steps (Ising process, herbivory and bookkeeping). Single-cell steps go in batches of 100, so the
+    compiled backend is measured by its kernels rather than its call overhead"""
+    n = 100 if sim.UPDATE_SCHEME == "random" else 1
+    sim.step(n)
+    return n
+
+
+CASES = {  # Benchmark name -> (function returning the units it performed, whether it depends on the herbivore count)
+    "flip": (bench_flip, False),
+    "potential": (bench_potential, False),
+    "get_total": (bench_get_total, False),
+    "herbivory": (bench_herbivory, True),
+    "init_grid": (bench_init_grid, False),
+    "step": (bench_step, True)
+}
+
+
+def measure(case, params, min_time=0.2):
+    """Times one case on a fresh Population built from params: units per second over at least min_time seconds
+    (after a warm-up call, which also compiles numba kernels), then peak traced memory over a build and one call"""
+    function, _ = CASES[case]
+    sim = isingsim.Population(**params)
+    function(sim)
+    units, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        units += function(sim)
+    rate = units / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(isingsim.Population(**params))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"rate": rate, "peak_bytes": peak}
+
+
+def run_benchmarks(cases=tuple(CASES), sizes=SIZES, herbivores=HERBIVORES, min_time=0.2, **params):
+    """Measures every case over the sizes (and, for herbivore-dependent cases, herbivore counts). Other Population
+    parameters (update_scheme, backend, sparse...) are passed through; runs are seeded so workloads repeat"""
+    results = []
+    for case in cases:
+        counts = herbivores if CASES[case][1] else herbivores[:1]
+        for size in sizes:
+            for count in counts:
+                result = measure(case, {"seed": 0, **params, "size": size, "NUM_OF_HERBIVORES": count}, min_time)
+                results.append({"case": case, "size": size, "herbivores": count, **result})
+                print(f"{case:>10} size={size:<5} herbivores={count:<6} {result['rate']:12.1f}/s {result['peak_bytes']/1e6:9.2f} MB",
+                      file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "numba": kernels.NUMBA_AVAILABLE,
+            "machine": platform.platform(),
+            "processor": platform.processor(),
+            "params": params,
+            "min_time": min_time
+        },
+        "results": results
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Finds the results that regressed against a baseline report: a rate more than `tolerance` (a fraction) below
+    the baseline's, or peak memory more than `tolerance` above it. Results missing from the baseline are skipped"""
+    base = {(r["case"], r["size"], r["herbivores"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = base.get((result["case"], result["size"], result["herbivores"]))
+        if old is None:
+            continue
+        if result["rate"] < old["rate"] * (1 - tolerance):
+            regressions.append({**result, "metric": "rate", "baseline": old["rate"]})
+        if result["peak_bytes"] > old["peak_bytes"] * (1 + tolerance):
+            regressions.append({**result, "metric": "peak_bytes", "baseline": old["peak_bytes"]})
+    return regressions
+
+
+def parse_list(text, kind=int):
+    """Parses "a,b,c" into a list"""
+    return [kind(value) for value in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation hot paths, reporting rates and peak memory as JSON")
+    parser.add_argument("-c", "--cases", type=lambda text: parse_list(text, str), default=list(CASES),
+                        help=f"Comma-separated cases (default all: {','.join(CASES)})")
+    parser.add_argument("-s", "--sizes", type=parse_list, default=SIZES, help="Comma-separated lattice sizes")
+    parser.add_argument("-n", "--herbivores", type=parse_list, default=HERBIVORES, help="Comma-separated herbivore counts")
+    parser.add_argument("-t", "--min-time", type=float, default=0.2, help="Seconds each measurement runs for (default 0.2)")
+    parser.add_argument("--update-scheme", default="random", help="Population update_scheme (default random)")
+    parser.add_argument("--backend", default="auto", help="Population backend (default auto)")
+    parser.add_argument("--sparse", action="store_true", help="Benchmark SparsePopulation")
+    parser.add_argument("-o", "--out", default=None, help="Write the JSON report here (default: standard output)")
+    parser.add_argument("-b", "--baseline", default=None, help="Earlier report to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional slowdown/memory growth (default 0.2)")
+    args = parser.parse_args()
+
+    for case in args.cases:
+        if case not in CASES:
+            parser.error(f"unknown case {case!r}, choose from {', '.join(CASES)}")
+    report = run_benchmarks(args.cases, args.sizes, args.herbivores, args.min_time,
+                            update_scheme=args.update_scheme, backend=args.backend, sparse=args.sparse)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["params"] != report["meta"]["params"]:
+            print(f"Warning: baseline was run with {baseline['meta']['params']}", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} size={r['size']} herbivores={r['herbivores']} {r['metric']}: "
+                  f"{r[r['metric']]:.1f} vs baseline {r['baseline']:.1f}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -1,13 +1,20 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
 from matplotlib.backend_bases import MouseButton
 from scipy import stats
+from store import ResultsStore, pinned
 
-# Collects three dataframes from manually named outputs that the simulations performed at different herbivory levels
-df1 = pd.read_csv("results/5x125-325_timelimit_lowH.csv")  # Low herbivory
-df2 = pd.read_csv("results/5x125-325_timelimit.csv")  # Medium herbivory
-df3 = pd.read_csv("results/5x125-325_timelimit_highH.csv")  # High herbivory
+# Runs are loaded from the results store by their parameters (each hand-named multi-run is imported if missing)
+store = ResultsStore("results/runs.sqlite")
+store.import_legacy()
+herbivory_levels = (  # Parameters of each herbivory level (others at their defaults), plus any other predicates (e.g. temp=(1.5, 3))
+    pinned(HERBIVORE_SPEED=0.5, BITE_COOLDOWN=2000, halt_condition="time_limit"),  # Low herbivory
+    pinned(HERBIVORE_SPEED=1., BITE_COOLDOWN=1000, halt_condition="time_limit"),  # Medium herbivory
+    pinned(HERBIVORE_SPEED=2., BITE_COOLDOWN=500, halt_condition="time_limit")  # High herbivory
+)
+df1, df2, df3 = (store.load(["temp", "activity", "undefended_attacks"], **level) for level in herbivory_levels)
 my_colours = ((0, 0, 1, 0.5), (0, 0, 0, 0.5), (1, 0, 0, 0.5))
 my_labels = ("Low", "Medium", "High")
 
@@ -16,17 +23,36 @@ for i, data in enumerate([df1, df2, df3]):
     data["H"] = pd.Series([i] * data.shape[0])  # An array of one number, the exact length of the dataframe
 df = pd.concat([df1, df2, df3])
 
+# Energy is linear in the cost vector: energy = -(cost_vector @ [activity, undefended_attacks]). So each level's
+# regression follows from sums over its runs, cached once here, and no pass over the runs is needed per cost vector
+def sufficient_statistics(data):
+    x = data.temp.to_numpy(float)
+    counts = data[["activity", "undefended_attacks"]].to_numpy(float)  # The two energy components, one row per run
+    return dict(n=len(x), x=x.sum(), xx=x @ x, y=counts.sum(axis=0), xy=x @ counts, yy=counts.T @ counts)
+sums = [sufficient_statistics(data) for data in [df1, df2, df3]]
+
+# Regression slope of each energy component against responsiveness, per level (rows), so slope = -(slopes @ cost)
+def component_slopes(s):
+    return (s["n"]*s["xy"] - s["x"]*s["y"]) / (s["n"]*s["xx"] - s["x"]**2)
+slopes = np.array([component_slopes(s) for s in sums])
+
 # Create a 1x2 plot. Left is data, right is cost vector
 fig, (ax1, ax2) = plt.subplots(ncols=2, figsize=(10,5), tight_layout=True)
 
 # The cost vector that will keep track of costs and be moved around when interacting with the plot
 cost_vector = [0, 0]
 
+# Runs drawn in the first plot: all of them, or a random sample when there are too many to redraw while dragging
+MAX_POINTS = 20000
+shown = np.arange(len(df)) if len(df) <= MAX_POINTS else np.sort(np.random.default_rng(0).choice(len(df), MAX_POINTS, replace=False))
+shown_counts = df[["activity", "undefended_attacks"]].to_numpy(float)[shown]  # Energy of the shown runs is -(shown_counts @ cost)
+offsets = np.stack([df.temp.to_numpy(float)[shown], -(shown_counts @ cost_vector)], axis=1)
+
 # The first scatterplot. Colours are according to herbivory level, Medium, Low, High
 data_scatterplot = ax1.scatter(
-    df.temp,
-    -(cost_vector[0]*df.activity + cost_vector[1]*df.undefended_attacks),
-    c=[my_colours[x] for x in df.H]
+    offsets[:, 0],
+    offsets[:, 1],
+    c=[my_colours[x] for x in df.H.to_numpy()[shown]]
     )
 ax1.set(
     xlabel="Signal Responsiveness",
@@ -47,29 +73,40 @@ ax2.set(
     title="Cost Phase",
     xlim=(0,1), ylim=(0,8)
     )
-# Approximate region boundary between negative and mixed
-X = np.arange(0, 1.1, 0.01)
-Y = -8*X * (X - 2)
-ax2.plot(X, Y, c="black", lw=0.6)
-# Approximate region boundary between positive and mixed
-X2 = np.arange(0.02, 0.2, 0.01)
-Y2 = 800 * X2**2
-ax2.plot(X2, Y2, c="black", lw=0.6)
-# Approximate region boundary between positive and mixed
-# X2 = np.arange(0, 0.022, 0.01)
-# Y3 = 0.379*X2/0.022
-# ax2.plot(X2, Y3, c="black", lw=0.6)
-
-# Performs the linear regression given the current cost vector
+# Fitness-sign map: at every cost vector, the number of levels whose energy rises with responsiveness (0 negative
+# region, 3 positive, otherwise mixed). Each level's slope changes sign on a line through the origin, drawn in its colour
+C0, C1 = np.meshgrid(np.linspace(0, 1, 400), np.linspace(0, 8, 400))
+rising = (-(C0[..., None]*slopes[:, 0] + C1[..., None]*slopes[:, 1]) > 0).sum(axis=-1)
+ax2.imshow(rising, origin="lower", extent=(0, 1, 0, 8), aspect="auto", vmin=0, vmax=3, alpha=0.15,
+           cmap=ListedColormap(["red", "grey", "grey", "green"]))
+X = np.array([0, 1])
+for i in range(3):
+    if slopes[i, 1]:
+        ax2.plot(X, -slopes[i, 0]/slopes[i, 1] * X, c=my_colours[i], lw=0.6)
+
+# Performs the linear regression given the current cost vector, from the cached sums (same results as stats.linregress)
 def perform_regression():
     results = []
     keys = ("slope", "intercept", "R", "P", "SE")
-    for data in [df1, df2, df3]:
-        x = data.temp
-        y = -(cost_vector[0]*data.activity + cost_vector[1]*data.undefended_attacks)
-        results.append(dict(zip(keys, stats.linregress(x, y))))
+    cost = -np.asarray(cost_vector, dtype=float)
+    for s in sums:
+        n, sy, sxy, syy = s["n"], s["y"] @ cost, s["xy"] @ cost, cost @ s["yy"] @ cost
+        ssxm, ssym, ssxym = s["xx"]/n - (s["x"]/n)**2, syy/n - (sy/n)**2, sxy/n - s["x"]*sy/n**2
+        slope = ssxym / ssxm
+        with np.errstate(divide="ignore", invalid="ignore"):  # No energy (zero costs) gives nan, as linregress does
+            r = np.clip(ssxym / np.sqrt(ssxm * ssym), -1, 1)
+            t = r * np.sqrt((n - 2) / ((1 - r) * (1 + r)))
+            se = np.sqrt((1 - r**2) * ssym / ssxm / (n - 2))
+        results.append(dict(zip(keys, (slope, (sy - slope*s["x"])/n, r, 2 * stats.t.sf(abs(t), n - 2), se))))
     return results
 
+# Regression lines, drawn once "r" has been pressed and then updated live with the cost vector
+regression_lines = []
+def draw_regression():
+    xlim = np.array(ax1.get_xlim())
+    for line, result in zip(regression_lines, perform_regression()):
+        line.set_data(xlim, result["intercept"] + result["slope"]*xlim)
+
 # Starts the moving process when the cost vector plot is clicked
 moving = False
 def on_click(event):
@@ -83,28 +120,23 @@ def on_move(event):
         global cost_vector
         cost_vector = [event.xdata, event.ydata]
         cost_scatterplot.set_offsets([cost_vector])
-        data_scatterplot.set_offsets(np.stack([df.temp, -(cost_vector[0]*df.activity + cost_vector[1]*df.undefended_attacks)]).T)
+        offsets[:, 1] = -(shown_counts @ cost_vector)
+        data_scatterplot.set_offsets(offsets)
+        draw_regression()
         plt.draw()
 
 # Performs the linear regression when the r key is pressed
 def on_press(event):
     if event.key == 'r':
-        # If a regression line has already been plotted, this removes the most recent ones so there aren't several
-        if len(ax1.lines) > 1:  # There is the y=0 line we don't want to remove
-            for i in range(3):
-                ax1.lines[-1].remove()
         results = perform_regression()
         print(results)
 
-        for i in range(3):
-            ax1.axline(
-                xy1=(0, results[i]["intercept"]),
-                slope=results[i]["slope"],
-                c=my_colours[i],
-                label=my_labels[i]
-                )
+        if not regression_lines:  # Lines are only made once, then moved
+            for i in range(3):
+                regression_lines.append(ax1.plot([], [], c=my_colours[i], label=my_labels[i], scalex=False, scaley=False)[0])
+            ax1.legend(title="Herbivory Level")
+        draw_regression()
         plt.draw()
-        ax1.legend(title="Herbivory Level")
 
 # Activates all of the interactive elements
 plt.connect("motion_notify_event", on_move)
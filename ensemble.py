@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+from isingsim import Population, acceptance_probability, acceptance_table, spawn_seeds
+
+
+class Ensemble:
+    """R independent populations, one per temperature, stacked along a leading batch axis and advanced together.
+    Each replica follows the same rules as a Population with the same parameters"""
+
+    def __init__(self, temps, seed=None, **params):
+        """temps holds one temperature per replica (repeat a temperature for replicates); params go to Population"""
+        if params.get("update_scheme", "random") in ("swendsen_wang", "wolff"):
+            raise ValueError("Ensemble supports the single-site schemes only, not cluster updates")
+        self.temps = np.asarray(temps, dtype=float)
+        self.R = len(self.temps)
+        # Replicas start exactly as the equivalent Populations would, then their state is stacked. The Ensemble
+        # steps them itself, so any backend (or start_temp) in params is overridden
+        members = [Population(**{**params, "start_temp": temp, "seed": member_seed, "backend": "numpy"})
+                   for temp, member_seed in zip(self.temps, spawn_seeds(seed, self.R))]
+        self.base = members[0]  # Shared geometry, constants and coordinate helpers
+        self.rng = np.random.default_rng(seed)
+        self.spins = np.stack([m.spins for m in members])  # (R, N, N)
+        self.time_active = np.stack([m.time_active for m in members])
+        self.h_pos = np.stack([m.h_pos for m in members])  # (R, H, 2)
+        self.h_vel = np.stack([m.h_vel for m in members])
+        self.h_cooldown = np.stack([m.h_cooldown for m in members])  # (R, H)
+        self.h_state = np.stack([m.h_state for m in members])
+        self.h_cell = np.stack([m.herbivore_index.cell for m in members])  # (R, H) flat cell ids, as of the last move
+        coupling = self.base.coupling  # Shared kernel and boundary
+        self.tables = (acceptance_table(self.temps[:, None], self.base.J, self.base.UPDATE_SCHEME, coupling.max_alignment)
+                       if coupling.integer else None)  # (R, 2*max_alignment + 1), 9 wide for nearest neighbours
+
+        self.replicas = np.arange(self.R)
+        self.running = np.ones(self.R, dtype=bool)  # Replicas that have not met the halting condition
+        self.steps = 0
+        self.elapsed = 0.
+        self.time = np.zeros(self.R)  # Logical seconds at which each replica halted
+        self.undefended_attacks = np.zeros(self.R, dtype=np.int64)
+        self.activity = np.zeros(self.R, dtype=np.int64)
+
+    def acceptance(self, alignment, rows):
+        """Flip probabilities of local alignments (dE = 2J * alignment) in the given replicas, as Population.acceptance"""
+        if self.tables is None:
+            return acceptance_probability(2 * self.base.J * alignment, self.temps[rows], self.base.UPDATE_SCHEME)
+        return self.tables[rows, alignment.astype(np.intp) + self.base.coupling.max_alignment]
+
+    def flip(self):
+        """Population.flip for one random cell in every running replica"""
+        base, spins, rows = self.base, self.spins, self.replicas
+        i, j = self.rng.integers(0, base.GRID_SIZE, (2, self.R))
+        spin = spins[rows, i, j]
+        field, weight = np.zeros((2, self.R), dtype=np.int64 if base.coupling.integer else np.float64)
+        for di, dj, w in base.coupling.offsets:
+            neighbours, valid = base.coupling.neighbour_cells(i, j, di, dj)
+            field += np.where(valid, w * spins.reshape(self.R, -1)[rows, neighbours], 0)
+            weight += np.where(valid, w, 0)
+        alignment = spin * field  # dE = 2J * alignment
+        # Random flip made impossible when every neighbour is aligned (max difference)
+        accept = self.running & (alignment < weight) & (self.rng.random(self.R) < self.acceptance(alignment, rows))
+        spins[rows[accept], i[accept], j[accept]] *= -1
+        self.activity += accept & (spin == -1)
+
+        # Active cells tick towards MAX_ACTIVATION and are forced to deactivate when it wraps to 0
+        active = self.running & (spins[rows, i, j] == 1)
+        ticked = (self.time_active[rows, i, j] + 1) % base.MAX_ACTIVATION
+        self.time_active[rows, i, j] = np.where(active, ticked, np.where(self.running, 0, self.time_active[rows, i, j]))
+        expired = active & (ticked == 0)
+        spins[rows[expired], i[expired], j[expired]] = -1
+
+    def sweep(self):
+        """Population.sweep (one checkerboard sweep per sublattice) for every running replica"""
+        base = self.base
+        running = self.running[:, None, None]
+        for sublattice in base.checkerboard:
+            alignment = self.spins * base.coupling.field(self.spins)
+            accept = (sublattice & running & base.coupling.unaligned(alignment)
+                      & (self.rng.random(self.spins.shape) < self.acceptance(alignment, self.replicas[:, None, None])))
+            self.spins[accept] *= -1
+            active = sublattice & running & (self.spins == 1)
+            self.activity += np.count_nonzero(accept & active, axis=(1, 2))
+
+            self.time_active[active] = (self.time_active[active] + 1) % base.MAX_ACTIVATION
+            self.spins[active & (self.time_active == 0)] = -1
+            self.time_active[sublattice & running & (self.spins == -1)] = 0
+
+    def herbivory(self, time_step):
+        """Population.herbivory for the herbivores of every running replica at once"""
+        base = self.base
+        # Living herbivores, replica by replica, as flat ids into the (R, H) arrays (which gather far faster)
+        alive = np.flatnonzero((self.h_state == 1) & self.running[:, None])
+        if not alive.size:
+            return
+        rep = alive // self.h_state.shape[1]
+        h_pos, h_vel, h_cooldown = self.h_pos.reshape(-1, 2), self.h_vel.reshape(-1, 2), self.h_cooldown.reshape(-1)
+        p, v = h_pos[alive], h_vel[alive]
+
+        # Random velocity rotation
+        angle = np.radians(self.rng.random(alive.size)*(2*base.TURN_FACTOR) - base.TURN_FACTOR)
+        cos, sin = np.cos(angle), np.sin(angle)
+        v = np.stack((v[:, 0]*cos - v[:, 1]*sin, v[:, 0]*sin + v[:, 1]*cos), axis=1)
+
+        # Defense-active cells and the border nudge velocity away (avoidance); periodic lattices have no border
+        rows, cols = np.divmod(self.h_cell.reshape(-1)[alive], base.GRID_SIZE)
+        rows, cols = rows + base.STENCIL[:, 1, None], cols + base.STENCIL[:, 0, None]  # 3x3 centred on each herbivore, (9, n)
+        if base.BOUNDARY == "periodic":
+            pushed = np.zeros(rows.shape, dtype=bool)
+            rows, cols = base.coupling.fold(rows), base.coupling.fold(cols)
+        else:
+            # base.on_screen of the 3x3 pixel probes, axis by axis (the herbivore itself is always on screen)
+            pitch, low, high = base.GRID_VEC[0], base.START_LOC, base.START_LOC + base.SCREEN_SIZE - 1
+            x, y = (np.stack((q - pitch > low[a], np.ones(q.shape, dtype=bool), q + pitch <= high[a])) for a, q in enumerate(p.T))
+            pushed = ~(y[:, None] & x[None]).reshape(rows.shape)  # Row-major, like STENCIL
+            rows, cols = rows.clip(0, base.GRID_SIZE - 1), cols.clip(0, base.GRID_SIZE - 1)
+        # Border cells are pushed whatever they read
+        pushed |= self.spins.reshape(-1)[(rep * base.GRID_SIZE + rows) * base.GRID_SIZE + cols] != -1
+        v += base.HERBIVORE_SPEED * base.PUSH_FACTOR * (pushed.T.astype(float) @ -base.STENCIL)
+
+        # Move, clamp (or wrap) and reset the velocity's magnitude
+        p = p + v * time_step
+        p = base.screen_wrap(p) if base.BOUNDARY == "periodic" else base.screen_clamp(p)
+        speed = np.hypot(v[:, 0], v[:, 1])
+        moving = speed > 0
+        v[moving] *= (base.HERBIVORE_SPEED / speed[moving])[:, None]
+        h_pos[alive], h_vel[alive] = p, v
+        cells = base.grid_coords(p)
+        self.h_cell.reshape(-1)[alive] = cells[:, 0] * base.GRID_SIZE + cells[:, 1]
+
+        # Perform attack based on cooldown
+        ready = h_cooldown[alive] <= 0
+        h_cooldown[alive[~ready]] -= 1
+        biters, rep = alive[ready], rep[ready]
+        if not biters.size:
+            return
+        h_cooldown[biters] = (base.BITE_COOLDOWN * (1 + self.rng.random(biters.size))).astype(int)
+        cells = (rep * base.GRID_SIZE + cells[ready, 0]) * base.GRID_SIZE + cells[ready, 1]  # Flat ids into spins
+        # Only the first herbivore biting a cell of a replica finds it inactive
+        first = np.zeros(biters.size, dtype=bool)
+        first[np.unique(cells, return_index=True)[1]] = True
+        bites = first & (self.spins.reshape(-1)[cells] == -1)
+
+        self.spins.reshape(-1)[cells[bites]] = 1
+        bitten = np.bincount(rep[bites], minlength=self.R)
+        self.undefended_attacks += bitten
+        self.activity += bitten
+
+        h_vel[biters[~bites]] = 0
+        self.h_state.reshape(-1)[biters[~bites]] = 0
+
+    def halted(self, halt_condition):
+        """Checks which replicas have met the halting condition"""
+        match halt_condition:
+            case "half_herbivores":
+                dead = np.count_nonzero(self.h_state == 0, axis=1)
+                return np.full(self.R, self.base.NUM_OF_HERBIVORES > 3) & (dead >= self.base.NUM_OF_HERBIVORES//2)
+            case "time_limit":
+                return np.full(self.R, self.elapsed >= self.base.TIME_LIMIT * 1000)
+        return np.zeros(self.R, dtype=bool)
+
+    def step(self, n=1, time_step=None, halt_condition=None):
+        """Advances every running replica n steps; replicas meeting the halting condition stop where they are"""
+        if time_step is None:
+            time_step = self.base.TIME_STEP
+        for _ in range(n):
+            if self.base.ISING_ON:
+                if self.base.UPDATE_SCHEME == "random":
+                    self.flip()
+                else:
+                    self.sweep()
+            self.herbivory(time_step)
+            self.steps += 1
+            self.elapsed += time_step
+            self.time[self.running] = round(self.elapsed / 1000, 1)
+            self.running &= ~self.halted(halt_condition)
+            if not self.running.any():
+                break
+
+    def run(self, steps=None, halt_condition="half_herbivores", time_step=None):
+        """Ensemble counterpart of simulate(): steps until every replica has halted (or steps have been taken)
+        and returns the replicas' records as a DataFrame"""
+        if steps is None and halt_condition is None:
+            raise ValueError("run needs a step count, a halting condition, or both")
+        if steps is None and not self.base.haltable(halt_condition):
+            raise ValueError(f"halt_condition {halt_condition!r} can never be met here, so run needs a step count")
+        self.running &= ~self.halted(halt_condition)
+        while self.running.any() and (steps is None or self.steps < steps):
+            self.step(self.base.CHUNK if steps is None else steps - self.steps, time_step, halt_condition)
+        return self.records()
+
+    def records(self):
+        """Gets every replica's record (the Population.record schema) as one DataFrame row each"""
+        return pd.DataFrame({
+            "time": self.time,
+            "undefended_attacks": self.undefended_attacks,
+            "activity": self.activity,
+            "temp": self.temps
+        })
@@ -0,0 +1,65 @@
+import json
+import time
+
+
+class Stats:
+    """Opt-in instrumentation for a Population (sim.stats = Stats(), or simulate(..., stats=Stats())): cumulative wall
+    time and call counts per phase, and counts of events. When `every` and `out` are set, a cumulative summary is
+    appended to out as a JSON line every `every` steps. Populations without stats skip all of this"""
+    EVENTS = ("flips_accepted", "flips_rejected", "bites", "deaths", "forced_deactivations")
+
+    def __init__(self, out=None, every=None):
+        self.out = out  # Path (appended to) or open text file the JSON lines go to
+        self.every = every  # Steps between JSON lines
+        self.time = {}  # Phase -> cumulative seconds
+        self.calls = {}  # Phase -> number of calls (steps for the compiled kernels)
+        self.events = dict.fromkeys(self.EVENTS, 0)
+        self.emitted = None  # Step of the last JSON line
+        self.start = self.last = time.perf_counter()
+
+    def mark(self):
+        """Starts timing the next phase"""
+        self.last = time.perf_counter()
+
+    def lap(self, phase, calls=1):
+        """Adds the time since the last mark (or lap) to a phase, and starts timing the next one"""
+        now = time.perf_counter()
+        self.time[phase] = self.time.get(phase, 0.) + now - self.last
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+        self.last = now
+
+    def count(self, event, n=1):
+        """Counts n occurrences of an event"""
+        self.events[event] += n
+
+    def __call__(self, sim):
+        """Step hook: writes a JSON line when the step count is a multiple of every"""
+        if self.every and not sim.steps % self.every:
+            self.emit(sim)
+
+    def summary(self, sim):
+        """Gets the cumulative phase costs, event counts and event rates (per wall-clock second) as a dict"""
+        wall = time.perf_counter() - self.start
+        flips = self.events["flips_accepted"] + self.events["flips_rejected"]
+        return {
+            "step": sim.steps,
+            "elapsed": sim.elapsed,  # Logical milliseconds
+            "wall": wall,
+            "phases": {phase: {"time": self.time[phase], "calls": self.calls[phase]} for phase in self.time},
+            "events": dict(self.events),
+            "rates": {event: count / wall for event, count in self.events.items()},
+            "acceptance": self.events["flips_accepted"] / flips if flips else None
+        }
+
+    def emit(self, sim):
+        """Appends the current summary to out as one JSON line (does nothing without out, or if this step is written)"""
+        if self.out is None or self.emitted == sim.steps:
+            return
+        self.emitted = sim.steps
+        line = json.dumps(self.summary(sim)) + "\n"
+        if isinstance(self.out, str):
+            with open(self.out, "a") as f:
+                f.write(line)
+        else:
+            self.out.write(line)
+            self.out.flush()
@@ -1,8 +1,292 @@
-from math import exp, sin, cos, atan2, pi, radians
+from functools import cached_property
+from math import exp
+import json
+import os
 import time
 import numpy as np
 import pandas as pd
-import pygame as pg
+import kernels
+
+
+def coupling_kernel(neighbourhood="von_neumann", signal_range=1):
+    """(2*signal_range + 1)^2 weights of the cells around a centre cell (0 at the centre): 1 within Manhattan distance
+    signal_range ("von_neumann"), 1 within Chebyshev distance signal_range ("moore"), or 1/distance within Euclidean
+    distance signal_range ("distance")"""
+    offsets = np.arange(-signal_range, signal_range + 1)
+    rows, cols = np.meshgrid(offsets, offsets, indexing="ij")
+    if neighbourhood == "von_neumann":
+        kernel = (abs(rows) + abs(cols) <= signal_range).astype(np.int8)
+    elif neighbourhood == "moore":
+        kernel = np.ones(rows.shape, dtype=np.int8)
+    else:
+        distance = np.hypot(rows, cols)
+        kernel = np.where(distance <= signal_range, 1 / np.maximum(distance, 1), 0.)
+    kernel[signal_range, signal_range] = 0
+    return kernel
+
+
+def acceptance_probability(dE, temp, update_scheme="metropolis"):
+    """Flip probability for an energy difference dE: min(1, exp(-dE/temp)), or 1/(1 + exp(dE/temp)) for heat bath"""
+    with np.errstate(over="ignore", divide="ignore"):
+        if update_scheme == "heat_bath":
+            return 1 / (1 + np.exp(dE / temp))
+        return np.minimum(1., np.exp(-dE / temp))
+
+
+def acceptance_table(temp, J=1, update_scheme="metropolis", max_alignment=4):
+    """Flip probability for each local alignment s*field in -max_alignment..max_alignment, i.e. dE = 2J*alignment,
+    for integer coupling weights (max_alignment is the kernel's total weight: 4 for nearest neighbours)"""
+    return acceptance_probability(2 * J * np.arange(-max_alignment, max_alignment + 1), temp, update_scheme)
+
+
+def fft_size(length):
+    """Smallest FFT length of at least length with no prime factor above 5 (where FFTs are fastest)"""
+    while True:
+        rest = length
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return length
+        length += 1
+
+
+class Coupling:
+    """How each cell of a size x size lattice is coupled to the cells around it: a kernel of weights (coupling_kernel)
+    under a boundary condition. Open boundaries leave out cells beyond the edges, periodic ones wrap around and
+    reflecting ones mirror the lattice about its edge cells (as np.pad's "reflect": the cell beyond an edge copies the
+    one inside it). A cell is never its own neighbour, so offsets that land back on the cell are left out"""
+    FFT_COST = 300  # Shift work (a unit per kernel cell, 8 per distinct weight) above which fields are FFT convolutions
+    PAD_MODES = {"open": "constant", "periodic": "wrap", "reflecting": "reflect"}
+
+    def __init__(self, size, neighbourhood="von_neumann", signal_range=1, boundary="open"):
+        self.size = size
+        self.boundary = boundary
+        self.radius = signal_range
+        self.kernel = coupling_kernel(neighbourhood, signal_range)
+        self.integer = self.kernel.dtype.kind == "i"  # Integer weights use acceptance tables, others exp() directly
+        self.offsets = [(int(a) - signal_range, int(b) - signal_range, self.kernel[a, b].item())
+                        for a, b in np.argwhere(self.kernel)]  # (row, column, weight) of each neighbour, row-major
+        self.groups = {}  # Weight -> (row, column) offsets with that weight
+        for di, dj, w in self.offsets:
+            self.groups.setdefault(w, []).append((di, dj))
+        # Largest possible field (every neighbour aligned), summed in the order a single cell's field is
+        self.max_alignment = sum(w for _, _, w in self.offsets)
+        self.dtype = (np.int8 if self.max_alignment <= 127 else np.int32) if self.integer else np.float64
+        self.fft = len(self.offsets) + 8 * len(self.groups) > self.FFT_COST  # Whether field() convolves by FFT
+
+    def index(self, index):
+        """Maps row (or column) indices, which may lie beyond the edges, onto the lattice. Returns them and which exist"""
+        index = np.asarray(index)
+        if self.boundary == "open":
+            inside = (index >= 0) & (index < self.size)
+            return np.where(inside, index, 0), inside
+        return self.fold(index), np.ones(index.shape, dtype=bool)
+
+    def fold(self, index):
+        """Wraps (periodic) or mirrors (reflecting) row or column indices back onto the lattice"""
+        if self.boundary == "periodic":
+            return index % self.size
+        period = max(2 * self.size - 2, 1)
+        index = index % period
+        return np.where(index < self.size, index, period - index)
+
+    def neighbour_cells(self, rows, cols, di, dj):
+        """Flat ids (row*size + column) of the neighbours at offset (di, dj) of the cells at (rows, cols), and which of
+        them exist (on the lattice, and not the cell itself)"""
+        r, inside_r = self.index(rows + di)
+        c, inside_c = self.index(cols + dj)
+        return r * self.size + c, inside_r & inside_c & ((r != rows) | (c != cols))
+
+    def interior(self, i, j):
+        """Checks whether cell (i, j) is clear of the edges, so every offset is a neighbour"""
+        return self.radius <= i < self.size - self.radius and self.radius <= j < self.size - self.radius
+
+    def cell_neighbours(self, i, j):
+        """Gets the neighbours of cell (i, j) as (row, column, weight)"""
+        if self.interior(i, j):
+            return [(i + di, j + dj, w) for di, dj, w in self.offsets]
+        cells = []
+        for di, dj, w in self.offsets:
+            r, c = i + di, j + dj
+            if not (0 <= r < self.size and 0 <= c < self.size):
+                if self.boundary == "open":
+                    continue
+                r, c = int(self.fold(r)), int(self.fold(c))
+                if r == i and c == j:
+                    continue
+            cells.append((r, c, w))
+        return cells
+
+    def field(self, spins):
+        """Weighted sum of the neighbours of every cell, over the last two axes (so stacked lattices work too): a sum
+        of shifted lattices (padded per the boundary; open ones are shifted in place, dropping what falls off), or an
+        FFT convolution for wide kernels"""
+        r, n = self.radius, self.size
+        if self.boundary != "open" or self.fft:
+            padded = np.pad(spins, [(0, 0)] * (spins.ndim - 2) + [(r, r)] * 2, mode=self.PAD_MODES[self.boundary])
+        if not self.fft:
+            total = np.zeros(spins.shape, dtype=self.dtype)
+            for w, shifts in self.groups.items():  # Shifts of equal weight are summed as integers, then weighted once
+                part = total if w == 1 else np.zeros(spins.shape, dtype=np.int8 if len(shifts) <= 127 else np.int32)
+                for di, dj in shifts:
+                    if self.boundary != "open":
+                        part += padded[..., r + di:r + di + n, r + dj:r + dj + n]
+                    elif abs(di) < n and abs(dj) < n:
+                        part[..., max(-di, 0):n - max(di, 0), max(-dj, 0):n - max(dj, 0)] += \
+                            spins[..., max(di, 0):n - max(-di, 0), max(dj, 0):n - max(-dj, 0)]
+                if part is not total:
+                    total += w * part
+        else:  # The kernel is symmetric, so its convolution is the same as the sum over shifts
+            shape = (fft_size(n + 4*r),) * 2
+            full = np.fft.irfft2(np.fft.rfft2(padded, shape) * np.fft.rfft2(self.kernel, shape), shape)
+            total = full[..., 2*r:2*r + n, 2*r:2*r + n]
+            if self.integer:
+                total = np.rint(total).astype(self.dtype)
+        if self.self_coupled:
+            total -= self.self_weight * spins
+        return total
+
+    @cached_property
+    def self_weight(self):
+        """Weight of the offsets that land back on each cell (mirrored edges, or periodic lattices narrower than the
+        kernel), which field() takes back out"""
+        index = np.arange(self.size)
+        weight = np.zeros((self.size,)*2, dtype=self.dtype)
+        for di, dj, w in self.offsets:
+            rows, inside_r = self.index(index + di)
+            cols, inside_c = self.index(index + dj)
+            weight += w * np.outer(inside_r & (rows == index), inside_c & (cols == index)).astype(self.dtype)
+        return weight
+
+    @cached_property
+    def self_coupled(self):
+        """Whether any offset lands back on its cell"""
+        return self.boundary != "open" and bool(self.self_weight.any())
+
+    @cached_property
+    def weight(self):
+        """Total neighbour weight of every cell, i.e. the field when every neighbour is aligned (4 middle, 3 edge and
+        2 corner for open nearest neighbours)"""
+        return self.field(np.ones((self.size,)*2, dtype=np.int8))
+
+    def unaligned(self, alignment):
+        """Checks which cells have a neighbour not aligned with them, i.e. alignment (spin * field) below the total
+        neighbour weight, allowing for the rounding of FFT fields with non-integer weights"""
+        if self.integer:
+            return alignment < self.weight
+        return alignment < self.weight - 1e-9 * self.max_alignment
+
+    def total_weight(self):
+        """Sum of every cell's neighbour weight, without building the lattice"""
+        index = np.arange(self.size)
+        total = 0
+        for di, dj, w in self.offsets:
+            rows, inside_r = self.index(index + di)
+            cols, inside_c = self.index(index + dj)
+            itself = np.count_nonzero(inside_r & (rows == index)) * np.count_nonzero(inside_c & (cols == index))
+            total += w * (np.count_nonzero(inside_r) * np.count_nonzero(inside_c) - itself)
+        return total
+
+    def sublattices(self):
+        """Partitions the lattice into masks of mutually uncoupled cells, which can be updated at once: the red and
+        black checkerboard for nearest neighbours, otherwise (radius + 1)^2 colours of a repeating block. On periodic
+        lattices whose side is not a multiple of the block, the last partial block gets colours of its own"""
+        index = np.arange(self.size)
+        if self.radius == 1 and not self.kernel[0, 0] and (self.boundary != "periodic" or self.size % 2 == 0):
+            parity = np.add.outer(index, index) % 2
+            return (parity == 0, parity == 1)
+        period = self.radius + 1
+        colour = index % period
+        if self.boundary == "periodic":
+            whole = self.size - self.size % period
+            colour = np.where(index < whole, colour, index - whole + period)
+        colours = np.add.outer(colour * (colour.max() + 1), colour)
+        return tuple(colours == c for c in np.unique(colours))
+
+
+class RandomBlocks:
+    """Serves random numbers drawn from a Generator in bulk blocks, so hot loops avoid one generator call per value"""
+    BLOCK_SIZE = 4096  # Values (rows) drawn per refill
+
+    def __init__(self, draw):
+        self.draw = draw  # draw(n) returns n new values (rows)
+        self.block = draw(self.BLOCK_SIZE)
+        self.index = 0
+
+    def refill(self, n):
+        """Makes sure the next n values are in the block, drawing more if they are not"""
+        if self.index + n > len(self.block):
+            self.block = np.concatenate((self.block[self.index:], self.draw(max(self.BLOCK_SIZE, n))))
+            self.index = 0
+
+    def take(self, n):
+        """Gets the next n values"""
+        self.refill(n)
+        self.index += n
+        return self.block[self.index - n:self.index]
+
+    def next(self):
+        """Gets the next single value"""
+        if self.index == len(self.block):
+            self.block = self.draw(self.BLOCK_SIZE)
+            self.index = 0
+        self.index += 1
+        return self.block[self.index - 1]
+
+
+class HerbivoreIndex:
+    """Cell -> herbivore occupancy index: living herbivores sorted by the flat id (row*size + column) of their cell.
+    Rebuilt once per step, so occupancy, density and crowding queries are O(H log H) array work, not O(H^2) scans"""
+
+    def __init__(self, size, count):
+        self.size = size  # Cells on each side of the lattice
+        self.cell = np.full(count, -1)  # Flat cell id of every herbivore (-1 when dead)
+        self.order = np.empty(0, dtype=int)  # Living herbivores sorted by cell (ties in herbivore order)
+        self.sorted_cells = np.empty(0, dtype=int)
+
+    def update(self, herbivores, cells):
+        """Re-indexes from the living herbivores and their (row, column) cells"""
+        self.cell[:] = -1
+        self.cell[herbivores] = cells[:, 0] * self.size + cells[:, 1]
+        self.order = herbivores[np.argsort(self.cell[herbivores], kind="stable")]
+        self.sorted_cells = self.cell[self.order]
+
+    def remove(self, herbivores):
+        """Drops herbivores (e.g. ones that just died) from the index"""
+        self.cell[herbivores] = -1
+        kept = self.cell[self.order] >= 0
+        self.order, self.sorted_cells = self.order[kept], self.sorted_cells[kept]
+
+    def count(self, cells):
+        """Number of living herbivores on each of the given flat cell ids"""
+        return np.searchsorted(self.sorted_cells, cells, "right") - np.searchsorted(self.sorted_cells, cells, "left")
+
+    def occupants(self, cell):
+        """Indices of the living herbivores on one flat cell id"""
+        return self.order[np.searchsorted(self.sorted_cells, cell, "left"):np.searchsorted(self.sorted_cells, cell, "right")]
+
+    def density(self):
+        """Number of living herbivores on every cell, as a (size, size) array"""
+        return np.bincount(self.sorted_cells, minlength=self.size**2).reshape(self.size, self.size)
+
+    def crowding(self, radius=1):
+        """Number of other living herbivores within a (2*radius + 1)^2 block of cells around each herbivore (0 if dead)"""
+        living = self.cell >= 0
+        rows, cols = np.divmod(self.cell, self.size)
+        total = np.zeros(len(self.cell), dtype=int)
+        for r in range(-radius, radius + 1):
+            for c in range(-radius, radius + 1):
+                inside = living & (rows + r >= 0) & (rows + r < self.size) & (cols + c >= 0) & (cols + c < self.size)
+                total[inside] += self.count(self.cell[inside] + r*self.size + c)
+        total[living] -= 1
+        return total
+
+    def first(self, herbivores):
+        """Marks, among the given herbivores (in order), the first one on each cell"""
+        first = np.zeros(len(herbivores), dtype=bool)
+        first[np.unique(self.cell[herbivores], return_index=True)[1]] = True
+        return first
 
 
 class Population:
@@ -13,9 +297,23 @@ class Population:
     J = 1  # Coupling constant
     THERMO_OFFSET = 20  # Thermometer distance from top and bottom
     THERMO_RANGE = (0, 5)  # Min an max temperatures
+    STENCIL = np.array([(c, r) for r in (-1, 0, 1) for c in (-1, 0, 1)])  # 3x3 (x, y) offsets herbivores look at
+    UPDATE_SCHEMES = ("random", "metropolis", "heat_bath", "swendsen_wang", "wolff")  # Single cell, checkerboard or cluster
+    BACKENDS = ("auto", "numpy", "numba")  # "auto" compiles the "random" scheme's loop with numba when installed
+    BOUNDARIES = ("open", "periodic", "reflecting")  # What lies beyond the lattice edges (see Coupling)
+    NEIGHBOURHOODS = ("von_neumann", "moore", "distance")  # Coupling kernels (see coupling_kernel)
+    CHUNK = 100000  # Steps simulate() asks for at a time when running until a halting condition
+    COMPILED_DRAWS = 2**16  # Least random numbers (or cells) the compiled kernels are refilled with when they run out
+    TIME_STEP = 1.5  # Logical milliseconds per headless step (about one frame of the interactive view)
+    TIME_LIMIT = 40  # Logical seconds before the "time_limit" halt condition is met
+
+    def __new__(cls, *args, sparse=False, **kwargs):
+        """Population(sparse=True) builds a SparsePopulation"""
+        return super().__new__(SparsePopulation if sparse and cls is Population else cls)
 
-    def __init__(self, size=10, randomize=False, NUM_OF_HERBIVORES=10, HERBIVORE_SPEED=1., BITE_COOLDOWN = 1000, start_temp=3., GAP_SIZE=0, PUSH_FACTOR=0.01, TURN_FACTOR=10., MAX_ACTIVATION=50, ISING_ON=True):
+    def __init__(self, size=10, randomize=False, NUM_OF_HERBIVORES=10, HERBIVORE_SPEED=1., BITE_COOLDOWN = 1000, start_temp=3., GAP_SIZE=0, PUSH_FACTOR=0.01, TURN_FACTOR=10., MAX_ACTIVATION=50, ISING_ON=True, update_scheme="random", seed=None, backend="auto", sparse=False, boundary="open", neighbourhood="von_neumann", signal_range=1):
         """Initialization: first group of variables are chosen, second depends on first, third is not chosen"""
+        self.params = {name: value for name, value in locals().items() if name != "self"}  # Constructor arguments
         self.GRID_SIZE = size  # Number of cells on each side of grid
         self.temp = start_temp  # 'Temperature' of the entire system (reactivity)
         self.NUM_OF_HERBIVORES = NUM_OF_HERBIVORES
@@ -26,25 +324,54 @@ class Population:
         self.TURN_FACTOR = TURN_FACTOR  # Max random turn in degrees
         self.MAX_ACTIVATION = MAX_ACTIVATION  # Number of ticks an active cell can receive before being forced to deactivate
         self.ISING_ON = ISING_ON  # Whether or not to do Ising step
+        if update_scheme not in self.UPDATE_SCHEMES:
+            raise ValueError(f"update_scheme must be one of {self.UPDATE_SCHEMES}, not {update_scheme!r}")
+        self.UPDATE_SCHEME = update_scheme  # "random" flips one cell per step, the others update the whole lattice per step
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}, not {backend!r}")
+        if backend == "numba" and not kernels.NUMBA_AVAILABLE:
+            raise ValueError('backend="numba" needs numba to be installed')
+        if sparse and (update_scheme != "random" or backend == "numba"):
+            raise ValueError('sparse=True supports the "random" update scheme on the numpy backend only')
+        if backend == "auto":
+            backend = "numba" if kernels.NUMBA_AVAILABLE and update_scheme == "random" and not sparse else "numpy"
+        self.BACKEND = backend  # Compiled single-site kernels ("numba") or the Python/NumPy methods ("numpy")
+        if boundary not in self.BOUNDARIES:
+            raise ValueError(f"boundary must be one of {self.BOUNDARIES}, not {boundary!r}")
+        if neighbourhood not in self.NEIGHBOURHOODS:
+            raise ValueError(f"neighbourhood must be one of {self.NEIGHBOURHOODS}, not {neighbourhood!r}")
+        if signal_range < 1:
+            raise ValueError(f"signal_range must be at least 1, not {signal_range!r}")
+        self.BOUNDARY = boundary  # Open, periodic (herbivores wrap around too) or reflecting edges
+        self.coupling = Coupling(size, neighbourhood, signal_range, boundary)  # Which cells signal to each cell, and how strongly
 
-        self.CELL_SIZE = 600//self.GRID_SIZE  # Side length of cell
+        self.CELL_SIZE = max(600//self.GRID_SIZE, 1)  # Side length of cell (at least a pixel, for lattices over 600 wide)
         self.SCREEN_SIZE = self.GRID_SIZE * (self.CELL_SIZE + self.GAP_SIZE)  # Size of lattice
         self.MIX_START = randomize  # Randomized start or not
-        self.GRID_VEC = pg.Vector2((self.CELL_SIZE + self.GAP_SIZE,)*2)
-
-        self.herbivores = []
-        for i in range(self.NUM_OF_HERBIVORES):
-            # Generates the herbivores with random start position, intitial velocity, and attack cooldown
-            self.herbivores.append(
-                {"p": np.random.random(2) * ((self.SCREEN_SIZE,)*2) + self.START_LOC,  # position
-                "v": pg.Vector2(*(np.random.random(2)*2-1)),  # velocity
-                "t": self.BITE_COOLDOWN*(1 + np.random.random()),
-                "state": 1  # Alive or dead
-                })
-            self.herbivores[i]["v"].scale_to_length(self.HERBIVORE_SPEED)
+        self.GRID_VEC = np.array((self.CELL_SIZE + self.GAP_SIZE,)*2)
+
+        # All randomness comes from this population's own generator (seed may be an int, SeedSequence or Generator)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.uniforms = RandomBlocks(self.rng.random)  # Acceptance draws, turn angles and bite cooldowns
+        self.cell_picks = RandomBlocks(lambda n: self.rng.integers(0, self.GRID_SIZE, (n, 2)))  # Random cells for flip()
+
+        # Generates the herbivores with random start position, intitial velocity, and attack cooldown (one row each)
+        self.h_pos = self.rng.random((self.NUM_OF_HERBIVORES, 2)) * self.SCREEN_SIZE + self.START_LOC  # position
+        self.h_vel = self.rng.random((self.NUM_OF_HERBIVORES, 2))*2-1  # velocity
+        self.h_vel *= self.HERBIVORE_SPEED / np.hypot(self.h_vel[:, 0], self.h_vel[:, 1])[:, None]
+        self.h_cooldown = self.BITE_COOLDOWN*(1 + self.rng.random(self.NUM_OF_HERBIVORES))
+        self.h_state = np.ones(self.NUM_OF_HERBIVORES, dtype=np.int8)  # Alive or dead
+        self.herbivore_index = HerbivoreIndex(self.GRID_SIZE, self.NUM_OF_HERBIVORES)  # Which herbivores are on which cell
+        self.herbivore_index.update(np.arange(self.NUM_OF_HERBIVORES), self.grid_coords(self.h_pos))
         self.init_grid()
         self.click_cooldown = 0
         self.info = None
+        self.steps = 0  # Number of steps taken
+        self.elapsed = 0.  # Logical time elapsed in milliseconds
+        self.observers = []  # Callables run with the population after every step (e.g. a renderer)
+        self.stats = None  # instrumentation.Stats when profiling (opt-in)
+        self.set_thermo()
         self.record = {
             "time": time.time(),
             "undefended_attacks": 0,
@@ -58,42 +385,60 @@ class Population:
             self.START_LOC[0]//2,
             self.THERMO_OFFSET + (self.temp/(self.THERMO_RANGE[1] - self.THERMO_RANGE[0])) * (self.SCREEN_SIZE - 2*self.THERMO_OFFSET)
             ]
-        self.thermo_display = text.render(str(round(self.temp, 1)), False, "white")
     
     def set_temp(self):
         """Sets the temperature based on the current thermostat pos"""
         self.temp = self.THERMO_RANGE[0] + self.THERMO_RANGE[1] * (self.thermo_pos[1] - self.THERMO_OFFSET)/(self.SCREEN_SIZE - 2 * self.THERMO_OFFSET)
-        self.thermo_display = text.render(str(round(self.temp, 1)), False, "white")
     
     def get_total(self):
-        """Gets total energy across the entire lattice"""
-        total = 0
-        for i, row in enumerate(self.grid):
-            for j, cell in enumerate(row):
-                if i + 1 < self.grid_size:  # Vertical coupling
-                    total += (-1, 1)[cell["spin"]] * (-1, 1)[self.grid[i + 1][j]["spin"]]
-                if j + 1 < self.grid_size:  # Horizontal coupling
-                    total += (-1, 1)[cell["spin"]] * (-1, 1)[row[j + 1]["spin"]]
-        return total
+        """Gets total energy across the entire lattice, -J/2 * sum(spin * field) (each coupled pair is seen from both ends)"""
+        return -self.J * float(np.sum(self.spins * self.coupling.field(self.spins), dtype=np.float64)) / 2
+
+    def get_magnetisation(self):
+        """Gets the mean spin across the entire lattice (+1 all active, -1 all inactive)"""
+        return float(np.mean(self.spins, dtype=np.float64))
+
+    def get_active_fraction(self):
+        """Gets the fraction of cells that are active"""
+        return np.count_nonzero(self.spins == 1) / self.spins.size
 
     def init_grid(self):
-        """Builds the starting lattice"""
-        self.grid = []
-        for i in range(self.GRID_SIZE):
-            self.grid.append([])
-            for j in range(self.GRID_SIZE):
-                self.grid[i].append({
-                    "spin": (-1, 1)[bool(np.random.randint(2))] if self.MIX_START else -1,
-                    "rect": pg.Rect(
-                        self.START_LOC[0] + (self.CELL_SIZE + self.GAP_SIZE)*j,
-                        self.START_LOC[1] + (self.CELL_SIZE + self.GAP_SIZE)*i,
-                        self.CELL_SIZE,
-                        self.CELL_SIZE),
-                    "time_active": 0})
+        """Builds the starting lattice: spins (+1/-1) and activity counters as contiguous arrays"""
+        if self.MIX_START:
+            self.spins = np.where(self.rng.integers(2, size=(self.GRID_SIZE,)*2), 1, -1).astype(np.int8)
+        else:
+            self.spins = np.full((self.GRID_SIZE,)*2, -1, dtype=np.int8)
+        self.time_active = np.zeros((self.GRID_SIZE,)*2, dtype=np.uint16)
+        self.checkerboard = self.coupling.sublattices()  # Red and black sublattices (no two coupled cells share one)
+        self.table_temp = None  # Temperature the cached acceptance table was built for
+
+    def lattice_arrays(self):
+        """Gets the lattice state as arrays to checkpoint"""
+        return {"spins": self.spins, "time_active": self.time_active}
+
+    def restore_lattice(self, arrays):
+        """Sets the lattice state from checkpointed arrays (from a dense or a sparse population)"""
+        if "spins" in arrays:
+            self.spins[...] = arrays["spins"]
+            self.time_active[...] = arrays["time_active"]
+        else:
+            self.spins[...] = -1
+            self.spins.flat[arrays["active"]] = 1
+            self.time_active[...] = 0
+            self.time_active.flat[arrays["activation_cells"]] = arrays["activation_values"]
+        self.table_temp = None
+
+    def cell_rect(self, i, j):
+        """Gets the (x, y, width, height) screen rectangle of a lattice cell"""
+        return (
+            self.START_LOC[0] + (self.CELL_SIZE + self.GAP_SIZE)*j,
+            self.START_LOC[1] + (self.CELL_SIZE + self.GAP_SIZE)*i,
+            self.CELL_SIZE,
+            self.CELL_SIZE)
     
     def grid_coords(self, coords):
-        """Converts from absolute coordinates to lattice coordinates"""
-        return ((coords - self.START_LOC) // (self.CELL_SIZE + self.GAP_SIZE))[[1,0]]
+        """Converts from absolute (x, y) coordinates to (row, column) lattice coordinates, along the last axis"""
+        return ((coords - self.START_LOC) // (self.CELL_SIZE + self.GAP_SIZE))[..., ::-1].astype(int)
     
     def grid_clamp(self, val):
         """Takes an (x, y) grid-coordinate input and clamps the values to be within the grid"""
@@ -102,41 +447,56 @@ class Population:
         return (x, y)
     
     def screen_clamp(self, val):
-        """Takes an (x,y) absolute-coordinate input and clamps the values to be within the grid"""
-        x = min(val[0], self.START_LOC[0] + self.SCREEN_SIZE - 1) if val[0] > self.START_LOC[0] else self.START_LOC[0] + 1.
-        y = min(val[1], self.START_LOC[1] + self.SCREEN_SIZE - 1) if val[1] > self.START_LOC[1] else self.START_LOC[1] + 1.
-        return (x, y)
+        """Takes (x,y) absolute-coordinate input (along the last axis) and clamps the values to be within the grid"""
+        return np.where(val > self.START_LOC, np.minimum(val, self.START_LOC + self.SCREEN_SIZE - 1), self.START_LOC + 1.)
+
+    def screen_wrap(self, val):
+        """Takes (x,y) absolute-coordinate input (along the last axis) and wraps the values around the grid (periodic)"""
+        return self.START_LOC + (val - self.START_LOC) % self.SCREEN_SIZE
+
+    def on_screen(self, val):
+        """Checks which (x,y) absolute coordinates are left unchanged by screen_clamp (i.e. lie within the grid)"""
+        return np.all((val > self.START_LOC) & (val <= self.START_LOC + self.SCREEN_SIZE - 1), axis=-1)
 
     def set(self, coords, val=0, convert_to_grid=False):
         """Sets the value of a cell, converting coordinates if specified. Flips value by default"""
         if convert_to_grid:
             coords = self.grid_coords(coords)
+        i, j = int(coords[0]), int(coords[1])
         if val:
-            self.grid[int(coords[0])][int(coords[1])]["spin"] = val
+            self.spins[i, j] = val
         else:
-            self.grid[int(coords[0])][int(coords[1])]["spin"] *= -1
+            self.spins[i, j] *= -1
 
-        if self.grid[int(coords[0])][int(coords[1])]["spin"] == 1:
+        if self.spins[i, j] == 1:
             self.record["activity"] += 1
     
     def get(self, coords, convert_to_grid=False):
         """Gets the spin value for the cell at the given coordinates, converting if specified"""
         if convert_to_grid:
             coords = self.grid_coords(coords)
-        return self.grid[int(coords[0])][int(coords[1])]["spin"]
+        return int(self.spins[int(coords[0]), int(coords[1])])
     
     def get_activation(self, coords, convert_to_grid=False):
         """Gets the activity counter for an individual, converting coordinates if specified"""
         if convert_to_grid:
             coords = self.grid_coords(coords)
-        return self.grid[int(coords[0])][int(coords[1])]["time_active"]
+        return int(self.time_active[int(coords[0]), int(coords[1])])
     
     def set_activation(self, coords, val, convert_to_grid=False):
         """Sets the activity counter of an individual, converting coordinates if specified"""
         if convert_to_grid:
             coords = self.grid_coords(coords)
-        self.grid[int(coords[0])][int(coords[1])]["time_active"] = val
+        self.time_active[int(coords[0]), int(coords[1])] = val
     
+    def is_active(self, cells):
+        """Checks which of the given flat cell ids (row*size + column) are active"""
+        return self.spins.flat[cells] == 1
+
+    def activate(self, cells):
+        """Sets the given flat cell ids active (their activity counters are left as they are)"""
+        self.spins.flat[cells] = 1
+
     def tick(self, coords, convert_to_grid=False):
         """Gets the spin value for the cell at the given coordinates, converting if specified"""
         if convert_to_grid:
@@ -145,84 +505,214 @@ class Population:
         if not self.get_activation(coords):
             self.set(coords, -1)
             self.set_activation(coords, 0)
+            if self.stats is not None:
+                self.stats.count("forced_deactivations")
     
+    def field(self, i, j):
+        """Gets the local field of cell (i, j), the weighted sum of its neighbours' spins, and the total weight of its
+        neighbours (the field when all of them are active)"""
+        coupling, spin = self.coupling, self.spins.item
+        field = weight = 0
+        if coupling.interior(i, j):
+            for di, dj, w in coupling.offsets:
+                field += w * spin(i + di, j + dj)
+            return field, coupling.max_alignment
+        for r, c, w in coupling.cell_neighbours(i, j):
+            field += w * spin(r, c)
+            weight += w
+        return field, weight
+
+    def fields(self, cells):
+        """field() for an array of flat cell ids (row*size + column), as (fields, weights) arrays"""
+        rows, cols = np.divmod(cells, self.GRID_SIZE)
+        field, weight = np.zeros((2, len(cells)), dtype=np.int64 if self.coupling.integer else np.float64)
+        for di, dj, w in self.coupling.offsets:
+            neighbours, valid = self.coupling.neighbour_cells(rows, cols, di, dj)
+            field[valid] += np.where(self.is_active(neighbours[valid]), w, -w)
+            weight[valid] += w
+        return field, weight
+
     def potential(self, coords):
         """Calculates the energy difference for a cell if its state were flipped"""
-        spin = self.get(coords)
-
-        neighbours = []
-        for i in [coords[0] - 1, coords[0] + 1]:
-            if i >= 0 and i < self.GRID_SIZE:
-                neighbours.append(self.get((i, coords[1])))
-        for j in [coords[1] - 1, coords[1] + 1]:
-            if j >= 0 and j < self.GRID_SIZE:
-                neighbours.append(self.get((coords[0], j)))
-        
-        current = -self.J * sum([spin * n for n in neighbours])
-        new = -self.J * sum([-spin * n for n in neighbours])
-
-        return new - current
+        i, j = int(coords[0]), int(coords[1])
+        return 2 * self.J * self.get((i, j)) * self.field(i, j)[0]  # (new - current) energy
     
-    def flip(self):
-        """Picks a random cell, does the energy calculation and flips accordingly"""
-        cell = np.random.randint(0, self.GRID_SIZE, 2)
-        dE = self.potential(cell)
+    def flip(self, cell=None):
+        """Picks a random cell (unless given), does the energy calculation and flips accordingly"""
+        if cell is None:
+            cell = self.cell_picks.next()
+        field, weight = self.field(int(cell[0]), int(cell[1]))
+        alignment = self.get(cell) * field
+        dE = 2 * self.J * alignment
         if dE < 0:
-            self.set(cell)
+            accepted = True
         else:
-            is_edge = (cell[0] in (0, self.GRID_SIZE-1), cell[1] in (0, self.GRID_SIZE-1))
-            # Random flip made impossible if E=8J for middle, 6J for edge, 4J for corner (max difference)
-            if dE < (8 - 2 * sum(is_edge)) * self.J and np.random.random() < exp(-(dE/self.temp)):
-                self.set(cell)
+            # Random flip made impossible when every neighbour is aligned (max difference: 8J for middle, 6J for edge,
+            # 4J for corner with open nearest-neighbour coupling)
+            accepted = alignment < weight and self.uniforms.next() < exp(-(dE/self.temp))
+        if accepted:
+            self.set(cell)
+        if self.stats is not None:
+            self.stats.count("flips_accepted" if accepted else "flips_rejected")
         if self.get(cell) == 1:
             self.tick(cell)
         else:
             self.set_activation(cell, 0)  # "Setting" to 0 flips between +1 and -1
     
+    def acceptance(self, alignment):
+        """Gets the flip probabilities of local alignments (dE = 2J * alignment) at the current temperature: from the
+        acceptance table, rebuilt only when the temperature changes, or directly for non-integer coupling weights"""
+        if not self.coupling.integer:
+            return acceptance_probability(2 * self.J * alignment, self.temp, self.UPDATE_SCHEME)
+        if self.table_temp != self.temp:
+            self.table = acceptance_table(self.temp, self.J, self.UPDATE_SCHEME, self.coupling.max_alignment)
+            self.table_temp = self.temp
+        return self.table[alignment.astype(np.intp) + self.coupling.max_alignment]  # Fields may be int8
+
+    def sweep(self):
+        """Updates every cell once via checkerboard sweeps (red then black half-sweeps for nearest neighbours, one
+        sweep per sublattice for wider kernels), using the acceptance table"""
+        for sublattice in self.checkerboard:
+            alignment = self.spins * self.coupling.field(self.spins)  # dE = 2J * alignment
+            # Random flip made impossible when every neighbour is aligned (max difference), as in flip()
+            accept = sublattice & self.coupling.unaligned(alignment) & (self.rng.random(self.spins.shape) < self.acceptance(alignment))
+            self.spins[accept] *= -1
+            active = sublattice & (self.spins == 1)
+            self.record["activity"] += int(np.count_nonzero(accept & active))
+            if self.stats is not None:
+                accepted = int(np.count_nonzero(accept))
+                self.stats.count("flips_accepted", accepted)
+                self.stats.count("flips_rejected", int(np.count_nonzero(sublattice)) - accepted)
+            self.tick_cells(sublattice)
+
+    def tick_cells(self, cells):
+        """tick() for every masked cell: active cells tick towards MAX_ACTIVATION and are forced to deactivate when it
+        wraps to 0, inactive cells have their counter reset"""
+        active = cells & (self.spins == 1)
+        self.time_active[active] = (self.time_active[active] + 1) % self.MAX_ACTIVATION
+        expired = active & (self.time_active == 0)
+        self.spins[expired] = -1
+        self.time_active[cells & (self.spins == -1)] = 0
+        if self.stats is not None:
+            self.stats.count("forced_deactivations", int(np.count_nonzero(expired)))
+
+    def cluster_update(self):
+        """Flips clusters of aligned coupled cells joined by bonds of probability 1 - exp(-2J*weight/temp): each cluster
+        with probability 1/2 ("swendsen_wang"), or the single cluster grown from a random cell ("wolff"). Cluster moves
+        follow the free Ising dynamics, so the max-difference restriction does not apply. Every cell is then ticked"""
+        if self.UPDATE_SCHEME == "swendsen_wang":
+            flipped = self.swendsen_wang_clusters()
+        else:
+            flipped = self.wolff_cluster()
+        self.spins[flipped] *= -1
+        self.record["activity"] += int(np.count_nonzero(flipped & (self.spins == 1)))
+        if self.stats is not None:  # Every cell is offered a flip: those in flipped clusters accept it
+            accepted = int(np.count_nonzero(flipped))
+            self.stats.count("flips_accepted", accepted)
+            self.stats.count("flips_rejected", flipped.size - accepted)
+        self.tick_cells(np.ones(self.spins.shape, dtype=bool))
+
+    def swendsen_wang_clusters(self):
+        """Labels the Swendsen-Wang clusters of the lattice and picks which of them flip"""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        spins = self.spins.ravel()
+        rows, cols = np.divmod(np.arange(spins.size), self.GRID_SIZE)
+        start, end = [], []
+        for di, dj, w in self.coupling.offsets:
+            if (di, dj) > (0, 0):  # Each pair once, from its later cell
+                continue
+            neighbours, valid = self.coupling.neighbour_cells(rows, cols, di, dj)
+            cells, neighbours = np.flatnonzero(valid), neighbours[valid]
+            bonded = (spins[cells] == spins[neighbours]) & (self.rng.random(cells.size) < -np.expm1(-2 * self.J * w / self.temp))
+            start.append(cells[bonded])
+            end.append(neighbours[bonded])
+        start, end = np.concatenate(start), np.concatenate(end)
+        bonds = coo_matrix((np.ones(start.size, dtype=np.int8), (start, end)), shape=(spins.size,)*2)
+        count, labels = connected_components(bonds, directed=False)
+        return (self.rng.random(count) < 0.5)[labels].reshape(self.spins.shape)
+
+    def wolff_cluster(self):
+        """Grows a Wolff cluster from a random cell, a whole frontier at a time. Each bond from the cluster to an
+        aligned neighbour outside it is tried once"""
+        i, j = self.cell_picks.next()
+        spins = self.spins.ravel()
+        seed = i * self.GRID_SIZE + j
+        cluster = np.zeros(spins.size, dtype=bool)
+        cluster[seed] = True
+        frontier = np.array([seed])
+        while frontier.size:
+            rows, cols = np.divmod(frontier, self.GRID_SIZE)
+            grown = []
+            for di, dj, w in self.coupling.offsets:
+                neighbours, valid = self.coupling.neighbour_cells(rows, cols, di, dj)
+                tried = neighbours[valid & (spins[neighbours] == spins[seed]) & ~cluster[neighbours]]
+                grown.append(tried[self.rng.random(tried.size) < -np.expm1(-2 * self.J * w / self.temp)])
+            frontier = np.unique(np.concatenate(grown))
+            cluster[frontier] = True
+        return cluster.reshape(self.spins.shape)
+
     def herbivory(self, time_step):
-        """Carries out a single step in the herbivory process: change direction, move, attack"""
-        # Uncomment this and remove 'for' to process one herbivory each frame instead of all
-        # h = self.herbivores[np.random.randint(len(self.herbivores))]
-        for h in self.herbivores:
-            if h["state"]:  # If herbivore is alive
-
-                h["v"].rotate_ip(np.random.random()*(2*self.TURN_FACTOR) - self.TURN_FACTOR)  # Random velocity rotation
-
-                # Defense-active cells nudge velocity away (avoidance)
-                surroundings = []
-                for r in (-1, 0, 1):
-                    for c in (-1, 0, 1):  # Looks in 3x3 centred on herbivore
-                        neighbour = h["p"] + self.GRID_VEC.elementwise()*(c, r)
-                        if not (tuple(neighbour) == self.screen_clamp(neighbour) and self.get(neighbour, convert_to_grid=True) == -1):
-                            # If neighbour is in grid and deactive, skip. Otherwise, nudge (active or border)
-                            surroundings.append(self.HERBIVORE_SPEED * self.PUSH_FACTOR * pg.Vector2(-c,-r))
-                push = pg.Vector2()
-                for vec in surroundings:
-                    push += vec  # Total push is sum of all neighbours, so [0,2] will be stronger than [1] and in the same direction
-                h["v"] += push
-
-                # Move according to new adjusted velocity
-                step = np.array(h["v"]) * time_step  # Time step normalizes movement according to framerate
-                h["p"] += step
-                h["p"] = np.array(self.screen_clamp(h["p"]), dtype="float64")  # Out of bounds check
-
-                try:
-                    h["v"].scale_to_length(self.HERBIVORE_SPEED)  # Reset velocity's magnitude
-                except ValueError:
-                    h["v"] = pg.Vector2([round(h["v"].x, 2), round(h["v"].y, 2)])
-
-                # Perform attack based on cooldown
-                if h["t"] > 0:
-                    h["t"] -= 1
-                else:  # If bite cooldown is 0
-                    h["t"] = int(self.BITE_COOLDOWN * (1 + np.random.random()))  # Ranges from 1x to 2x base cooldown
-                    if self.get(h["p"], convert_to_grid=True) == 1:  # Attacking active cell
-                        if h["v"].magnitude_squared():
-                            h["v"].scale_to_length(0)
-                        h["state"] = 0
-                    else:  # Attacking inactive cell
-                        self.set(h["p"], 1, convert_to_grid=True)
-                        self.record["undefended_attacks"] += 1
+        """Carries out a single step in the herbivory process for the whole swarm at once: change direction, move, attack"""
+        alive = np.flatnonzero(self.h_state)
+        if not alive.size:
+            return
+        p, v = self.h_pos[alive], self.h_vel[alive]
+
+        # Random velocity rotation
+        angle = np.radians(self.uniforms.take(alive.size)*(2*self.TURN_FACTOR) - self.TURN_FACTOR)
+        cos, sin = np.cos(angle), np.sin(angle)
+        v = np.stack((v[:, 0]*cos - v[:, 1]*sin, v[:, 0]*sin + v[:, 1]*cos), axis=1)
+
+        # Defense-active cells nudge velocity away (avoidance)
+        rows, cols = np.divmod(self.herbivore_index.cell[alive], self.GRID_SIZE)  # Cells as of the last index update
+        rows, cols = rows + self.STENCIL[:, 1, None], cols + self.STENCIL[:, 0, None]  # Looks in 3x3 centred on herbivore, shape (9, H)
+        if self.BOUNDARY == "periodic":  # Herbivores see (and move) across the edges, which do not push
+            pushed = np.zeros(rows.shape, dtype=bool)
+            rows, cols = self.coupling.fold(rows), self.coupling.fold(cols)
+        else:
+            pushed = ~self.on_screen(p + (self.GRID_VEC * self.STENCIL)[:, None])
+        pushed[~pushed] = self.is_active(rows[~pushed]*self.GRID_SIZE + cols[~pushed])  # Border always nudges, otherwise nudge if active
+        # Total push is sum of all neighbours, so [0,2] will be stronger than [1] and in the same direction
+        v += self.HERBIVORE_SPEED * self.PUSH_FACTOR * (pushed.T.astype(float) @ -self.STENCIL)
+
+        # Move according to new adjusted velocity
+        p = p + v * time_step  # Time step normalizes movement according to framerate, then out of bounds check
+        p = self.screen_wrap(p) if self.BOUNDARY == "periodic" else self.screen_clamp(p)
+
+        speed = np.hypot(v[:, 0], v[:, 1])
+        moving = speed > 0
+        v[moving] *= (self.HERBIVORE_SPEED / speed[moving])[:, None]  # Reset velocity's magnitude
+        self.h_pos[alive], self.h_vel[alive] = p, v
+        self.herbivore_index.update(alive, self.grid_coords(p))
+
+        # Perform attack based on cooldown
+        ready = self.h_cooldown[alive] <= 0
+        self.h_cooldown[alive[~ready]] -= 1
+        biters = alive[ready]
+        if biters.size:
+            self.h_cooldown[biters] = (self.BITE_COOLDOWN * (1 + self.uniforms.take(biters.size))).astype(int)  # Ranges from 1x to 2x base cooldown
+            self.bite(biters)
+
+    def bite(self, biters):
+        """Resolves the attacks of the given herbivores in bulk, through the herbivore index"""
+        cells = self.herbivore_index.cell[biters]
+        # Only the first herbivore biting a cell finds it inactive; any later ones that step hit an activated cell
+        bites = self.herbivore_index.first(biters) & ~self.is_active(cells)
+
+        # Attacking inactive cell
+        self.activate(cells[bites])
+        self.record["undefended_attacks"] += int(np.count_nonzero(bites))
+        self.record["activity"] += int(np.count_nonzero(bites))
+
+        # Attacking active cell
+        self.h_vel[biters[~bites]] = 0
+        self.h_state[biters[~bites]] = 0
+        self.herbivore_index.remove(biters[~bites])
+        if self.stats is not None:
+            self.stats.count("bites", int(np.count_nonzero(bites)))
+            self.stats.count("deaths", int(np.count_nonzero(~bites)))
 
     def click(self, mouse_pos):
         """Adjusts thermostat or flips cell according to where user clicks"""
@@ -237,131 +727,426 @@ class Population:
     def right_click(self, mouse_pos):
         """Reveals extra information in DEBUG mode"""
         coords = self.grid_coords(mouse_pos)
-        self.set_info(self.grid[coords[0]][coords[1]]["time_active"])
-    
-    def draw_grid(self):
-        """Draws lattice of cells"""
-        for i, row in enumerate(self.grid):  # Draw lattice cells
-            for j, cell in enumerate(row):
-                pg.draw.rect(screen, self.COLOURS[cell["spin"]], cell["rect"])
-                if DEBUG:
-                    pg.draw.rect(screen, (0, 255*cell["time_active"]/self.MAX_ACTIVATION, 0), pg.Rect(
-                            self.START_LOC[0] + (self.CELL_SIZE + self.GAP_SIZE)*j,
-                            self.START_LOC[1] + (self.CELL_SIZE + self.GAP_SIZE)*i,
-                            max(1, self.CELL_SIZE/10),
-                            max(1, self.CELL_SIZE/10)))
-    
-    def draw_options(self):
-        """Draws thermostat, and other future options if added"""
-        pg.draw.circle(screen, "green", self.thermo_pos, self.START_LOC[0]//3)
-    
-    def draw_herbivores(self):
-        for h in self.herbivores:
-            pg.draw.circle(screen, ("black", "white")[h["state"]], h["p"], max(self.CELL_SIZE/5, 1))
-    
+        self.set_info(self.get_activation(coords))
+
     def set_info(self, val):
-        """Sets info text (used for debugging)"""
-        self.info = text.render(str(val), False, "white")
-
-def run(sim, debug_mode=False, iteration="", halt_condition="half_herbivores"):
-    """Simulation main"""
-    global clock, running, screen, text, DEBUG
-    DEBUG = debug_mode
-    # Pygame initialization (graphics)
-    pg.init()
-    pg.display.set_caption(f"Ising Simulation {iteration}")
-    clock = pg.time.Clock()
-    running = True
-    screen = pg.display.set_mode((sim.SCREEN_SIZE + sim.START_LOC[0], sim.SCREEN_SIZE + sim.START_LOC[1]))
-    text = pg.font.SysFont("moderno20", sim.START_LOC[0])
-    sim.set_thermo()  # This is not done in class initialization because it needs the pygame text object (and screen needs class info)
-
-    # Game (simulation) loop
-    while running:
-        for event in pg.event.get():
-            # Exits on closing 'X' click
-            if event.type == pg.QUIT:
-                running = False
-
-        dt = clock.tick()  # Dynamic time interval for constant herbivore speeds
-
-        if sim.ISING_ON:
-            sim.flip()  # Ising process
-        sim.herbivory(dt)  # Move/attack process
-
-        # Checks for clicks (and counts cooldown)
-        if sim.click_cooldown:
-            sim.click_cooldown -= 1
-        button_clicks = pg.mouse.get_pressed()
-        if button_clicks[0]:
-            sim.click(np.array(pg.mouse.get_pos()))
-        if button_clicks[2]:
-            sim.right_click(np.array(pg.mouse.get_pos()))
-
-        # Clear screen (black), draw lattice -> options (thermostat) -> herbivores
-        screen.fill("black")
-        sim.draw_grid()
-        sim.draw_options()
-        sim.draw_herbivores()
-        
-        # Draw text display(s)
-        screen.blit(sim.thermo_display, (0, 0))
-        if DEBUG:
-            if type(sim.info) == pg.surface.Surface:
-                screen.blit(sim.info, sim.START_LOC)
-
-        pg.display.flip()  # Redraws screen
+        """Sets info value (used for debugging)"""
+        self.info = val
+
+    def step(self, n=1, time_step=None, halt_condition=None):
+        """Advances the simulation n steps of fixed logical length (in ms) without any rendering,
+        stopping early if the halting condition is met (and not stepping at all if it already is)"""
+        if self.halted(halt_condition):
+            return
+        if time_step is None:
+            time_step = self.TIME_STEP
+        if self.BACKEND == "numba":
+            return self.compiled_step(n, time_step, halt_condition)
+        stats = self.stats  # Phases are only timed when profiling
+        ising = {"random": "flip", "metropolis": "sweep", "heat_bath": "sweep"}.get(self.UPDATE_SCHEME, "cluster_update")
+        for _ in range(n):
+            if stats is not None:
+                stats.mark()
+            if self.ISING_ON:  # Ising process
+                if self.UPDATE_SCHEME == "random":
+                    self.flip()
+                elif self.UPDATE_SCHEME in ("swendsen_wang", "wolff"):
+                    self.cluster_update()
+                else:
+                    self.sweep()
+                if stats is not None:
+                    stats.lap(ising)
+            self.herbivory(time_step)  # Move/attack process
+            if stats is not None:
+                stats.lap("herbivory")
+            self.steps += 1
+            self.elapsed += time_step
+            for observer in self.observers:
+                observer(self)
+            if stats is not None:
+                stats.lap("observers")
+                stats(self)
+            if self.halted(halt_condition):
+                break
+
+    def compiled_step(self, n, time_step, halt_condition):
+        """step() through the numba kernels: same random-sequential flip and per-herbivore semantics, run in
+        compiled chunks. Observers are called after each chunk; an observer with an `every` attribute (such as a
+        Recorder) is guaranteed a call at every multiple of it, any other observer is called after every step.
+        The kernels draw from the uniforms and cell_picks blocks in order, so the chunking does not change the run.
+        Profiling times flip and herbivory together, as one compiled_step phase"""
+        halt_dead = self.NUM_OF_HERBIVORES//2 if halt_condition == "half_herbivores" and self.NUM_OF_HERBIVORES > 3 else self.NUM_OF_HERBIVORES + 1
+        halt_elapsed = self.TIME_LIMIT * 1000 if halt_condition == "time_limit" else np.inf
+        # Undefended attacks and activity, then the instrumentation events: flips accepted and rejected, deaths and forced deactivations
+        counters = np.array((self.record["undefended_attacks"], self.record["activity"], 0, 0, 0, 0), dtype=np.int64)
+        stats = self.stats
+        hooks = self.observers + ([stats] if stats is not None and stats.every else [])
+        coupling = self.coupling
+        offsets = np.array([(di, dj) for di, dj, _ in coupling.offsets], dtype=np.int64)
+        weights = np.array([w for _, _, w in coupling.offsets], dtype=np.float64)
+        while n > 0:
+            chunk = n
+            for observer in hooks:
+                every = getattr(observer, "every", 1)
+                chunk = min(chunk, every - self.steps % every)
+            if stats is not None:
+                stats.mark()
+                attacks = counters[0]
+            # Integer weights look flip probabilities up in the table, others use exp(-2J * alignment / temp)
+            table = acceptance_table(self.temp, self.J, max_alignment=coupling.max_alignment) if coupling.integer else np.empty(0)
+            taken = 0
+            while True:
+                cursor = np.array((self.uniforms.index, self.cell_picks.index), dtype=np.int64)
+                count, self.elapsed, starved = kernels.run_steps(
+                    chunk - taken, self.uniforms.block, self.cell_picks.block, cursor, self.spins, self.time_active,
+                    self.h_pos, self.h_vel, self.h_cooldown, self.h_state, counters, offsets, weights,
+                    self.BOUNDARIES.index(self.BOUNDARY), table, int(coupling.max_alignment), 2 * self.J / self.temp,
+                    self.elapsed, time_step, self.ISING_ON, self.MAX_ACTIVATION, *self.START_LOC.astype(float),
+                    self.CELL_SIZE + self.GAP_SIZE, self.SCREEN_SIZE, self.HERBIVORE_SPEED, self.PUSH_FACTOR,
+                    self.TURN_FACTOR, self.BITE_COOLDOWN, halt_dead, halt_elapsed)
+                self.uniforms.index, self.cell_picks.index = int(cursor[0]), int(cursor[1])
+                taken += count
+                if not starved:
+                    break
+                # Refilled with draws for many steps at once, so that kernel calls stay rare
+                self.uniforms.refill(max(self.COMPILED_DRAWS, 16 * (1 + 2 * np.count_nonzero(self.h_state))))
+                self.cell_picks.refill(self.COMPILED_DRAWS)
+            self.steps += taken
+            n -= taken
+            self.record["undefended_attacks"], self.record["activity"] = int(counters[0]), int(counters[1])
+            alive = np.flatnonzero(self.h_state)
+            self.herbivore_index.update(alive, self.grid_coords(self.h_pos[alive]))
+            if stats is not None:
+                stats.lap("compiled_step", taken)
+                for event, count in zip(("bites", "flips_accepted", "flips_rejected", "deaths", "forced_deactivations"),
+                                        (counters[0] - attacks, *counters[2:])):
+                    stats.count(event, int(count))
+                counters[2:] = 0
+            for observer in self.observers:
+                observer(self)
+            if stats is not None:
+                stats.lap("observers")
+                stats(self)
+            if taken < chunk:  # Halted
+                break
 
+    def halted(self, halt_condition):
+        """Checks whether the given halting condition has been met (logical time is used for time limits)"""
         match halt_condition:
             case "half_herbivores":
-                if sim.NUM_OF_HERBIVORES > 3 and sum([not h["state"] for h in sim.herbivores]) >= sim.NUM_OF_HERBIVORES//2:
-                    sim.record["time"] = round(time.time() - sim.record["time"], 1)
-                    sim.record["temp"] = sim.temp
-                    running = False
-            
+                return self.NUM_OF_HERBIVORES > 3 and np.count_nonzero(self.h_state == 0) >= self.NUM_OF_HERBIVORES//2
             case "time_limit":
-                if time.time() - sim.record["time"] >= 40:
-                    running = False
-
-
-"""All-default population (for reference) -----=====-----"""
-run(Population())  # This is exactly the same as the defaults written below.
-
-# run(Population(
-#     size=10,  # 10
-#     randomize=False,  # False
-#     NUM_OF_HERBIVORES=10,  # 10
-#     HERBIVORE_SPEED=1,  # 1
-#     BITE_COOLDOWN=1000,  # 1000
-#     start_temp=3.,  # 3
-#     GAP_SIZE=0,  # 0
-#     PUSH_FACTOR=0.01,  # 0.01
-#     TURN_FACTOR=10,  # 10
-#     MAX_ACTIVATION=50,  # 50
-#     ISING_ON=True),  # True
-#     debug_mode=False,  # False
-#     halt_condition="half_herbivores"  # half_herbivores
-#     )
-
-"""Multi-run data generation -----=====-----"""
-# Example here is for responsiveness ranging from 1.25 to 3.5 at intervals of 0.25, done 5 times for each value
-# Here, herbivory is set low (half speed, double bite cooldown). The output is named accordingly.
-
-# data = []
-# iterations = 5
-# temp_range = np.arange(1.25, 3.5, 0.25)
-# for i in range(iterations):
-#     for j, t in enumerate(temp_range):
-#         sim = Population(start_temp=t, HERBIVORE_SPEED=0.5, BITE_COOLDOWN=2000)
-#         run(sim, iteration=f"{i * len(temp_range) + j + 1}/{len(temp_range)*iterations}", halt_condition="time_limit")
-#         data.append(sim.record)
-# data.append(sim.record)
-# data = pd.DataFrame(data)
-# data.to_csv("results/5x125-325_timelimit_lowH.csv", index=False)
-
-"""Large-field example -----=====-----"""
-# run(Population(size=20, HERBIVORE_SPEED=1, NUM_OF_HERBIVORES=20, PUSH_FACTOR=0.03, BITE_COOLDOWN=2000))
-
-"""Avoidance example -----=====-----"""
-# Click on cells near the herbivore to observe the avoidance mechanism clearly
-# run(Population(HERBIVORE_SPEED=1, NUM_OF_HERBIVORES=1, TURN_FACTOR=0, ISING_ON=False, PUSH_FACTOR=.01, BITE_COOLDOWN=100000))
\ No newline at end of file
+                return self.elapsed >= self.TIME_LIMIT * 1000
+        return False
+
+    def haltable(self, halt_condition):
+        """Checks whether the given halting condition can ever be met (half of at most three herbivores never counts)"""
+        return halt_condition == "time_limit" or (halt_condition == "half_herbivores" and self.NUM_OF_HERBIVORES > 3)
+
+    def save(self, path):
+        """Writes a checkpoint of the full simulation state (lattice, herbivores, random generator and its buffered
+        draws, counters, step count and parameters) to a compressed .npz. The file is replaced atomically"""
+        state = {
+            "params": {**self.params, "seed": self.seed if isinstance(self.seed, int) else None},
+            "rng": self.rng.bit_generator.state,
+            "record": self.record,
+            "steps": self.steps,
+            "elapsed": self.elapsed,
+            "temp": self.temp,
+            "click_cooldown": self.click_cooldown
+        }
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(
+                f, state=json.dumps(state, default=lambda value: value.tolist()), **self.lattice_arrays(),
+                h_pos=self.h_pos, h_vel=self.h_vel, h_cooldown=self.h_cooldown, h_state=self.h_state,
+                uniforms=self.uniforms.block, uniforms_index=self.uniforms.index,
+                cell_picks=self.cell_picks.block, cell_picks_index=self.cell_picks.index)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """Restores a population from a checkpoint written by save(). It continues exactly as the saved one would have"""
+        arrays, state = read_checkpoint(path)
+        rng = np.random.Generator(getattr(np.random, state["rng"]["bit_generator"])())
+        sim = cls(**{**state["params"], "seed": rng})
+        sim.seed = sim.params["seed"] = state["params"]["seed"]
+        sim.rng.bit_generator.state = state["rng"]
+        sim.uniforms.block, sim.uniforms.index = arrays["uniforms"], int(arrays["uniforms_index"])
+        sim.cell_picks.block, sim.cell_picks.index = arrays["cell_picks"], int(arrays["cell_picks_index"])
+        sim.restore(arrays)
+        sim.temp = state["temp"]
+        sim.set_thermo()
+        sim.record = state["record"]
+        sim.steps, sim.elapsed = state["steps"], state["elapsed"]
+        sim.click_cooldown = state["click_cooldown"]
+        return sim
+
+    @classmethod
+    def fork(cls, path, seed=None, **overrides):
+        """Starts a new run from the lattice and herbivores of a checkpoint (e.g. an equilibrated one), with its own
+        seed and any parameters overridden. Counters, step count and logical time start again from zero"""
+        arrays, state = read_checkpoint(path)
+        params = {**state["params"], **overrides, "seed": seed}
+        for name in ("size", "NUM_OF_HERBIVORES"):
+            if params[name] != state["params"][name]:
+                raise ValueError(f"{name} cannot be changed when forking a checkpoint")
+        sim = cls(**params)
+        sim.restore(arrays)
+        if "start_temp" not in overrides:  # Keeps a temperature set on the thermostat
+            sim.temp = state["temp"]
+            sim.record["temp"] = sim.temp
+            sim.set_thermo()
+        if sim.HERBIVORE_SPEED != state["params"]["HERBIVORE_SPEED"] * 0.6 / sim.GRID_SIZE:  # Rescales the velocities
+            speed = np.hypot(sim.h_vel[:, 0], sim.h_vel[:, 1])
+            moving = speed > 0
+            sim.h_vel[moving] *= (sim.HERBIVORE_SPEED / speed[moving])[:, None]
+        return sim
+
+    def restore(self, arrays):
+        """Sets the lattice and herbivores from checkpointed arrays"""
+        self.restore_lattice(arrays)
+        self.h_pos[...], self.h_vel[...] = arrays["h_pos"], arrays["h_vel"]
+        self.h_cooldown[...], self.h_state[...] = arrays["h_cooldown"], arrays["h_state"]
+        alive = np.flatnonzero(self.h_state)
+        self.herbivore_index.update(alive, self.grid_coords(self.h_pos[alive]))
+
+
+class Checkpointer:
+    """Population observer that saves a checkpoint to path every `every` steps"""
+
+    def __init__(self, path, every):
+        self.path = path
+        self.every = every  # Steps between checkpoints
+
+    def __call__(self, sim):
+        """Observer hook: checkpoints the population when the step count is a multiple of every"""
+        if not sim.steps % self.every:
+            sim.save(self.path)
+
+
+def read_checkpoint(path):
+    """Reads a file written by Population.save, returning ({name: array}, state)"""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files if name != "state"}, json.loads(str(data["state"]))
+
+
+class SparsePopulation(Population):
+    """Population(sparse=True) for large, mostly inactive lattices: only the active cells (as flat ids row*size + column)
+    and the nonzero activity counters are stored, so memory and per-step cost follow the active region, not size^2.
+    The random-site schedule is exactly that of a dense population: an inactive cell with no active neighbour has
+    every neighbour aligned (the max difference), so picking it changes nothing and no acceptance draw is made"""
+
+    def init_grid(self):
+        """Builds the starting lattice as a set of active cells and a dict of activity counters"""
+        if self.MIX_START:  # Drawn as the dense lattice would be, so seeded runs match
+            self.active = set(np.flatnonzero(self.rng.integers(2, size=(self.GRID_SIZE,)*2)).tolist())
+        else:
+            self.active = set()
+        self.activations = {}  # Flat cell id -> time_active, for nonzero counters only
+        self.table_temp = None
+
+    def lattice_arrays(self):
+        """Gets the lattice state as arrays to checkpoint"""
+        return {
+            "active": np.fromiter(self.active, dtype=np.int64, count=len(self.active)),
+            "activation_cells": np.fromiter(self.activations, dtype=np.int64, count=len(self.activations)),
+            "activation_values": np.fromiter(self.activations.values(), dtype=np.uint16, count=len(self.activations))
+        }
+
+    def restore_lattice(self, arrays):
+        """Sets the lattice state from checkpointed arrays (from a dense or a sparse population)"""
+        if "spins" in arrays:
+            self.active = set(np.flatnonzero(arrays["spins"] == 1).tolist())
+            cells = np.flatnonzero(arrays["time_active"])
+            self.activations = dict(zip(cells.tolist(), arrays["time_active"].flat[cells].tolist()))
+        else:
+            self.active = set(arrays["active"].tolist())
+            self.activations = dict(zip(arrays["activation_cells"].tolist(), arrays["activation_values"].tolist()))
+        self.table_temp = None
+
+    @property
+    def spins(self):
+        """Dense spin array built from the active set (for views; costs size^2)"""
+        spins = np.full((self.GRID_SIZE,)*2, -1, dtype=np.int8)
+        spins.flat[list(self.active)] = 1
+        return spins
+
+    @property
+    def time_active(self):
+        """Dense activity counter array built from the stored counters (for views; costs size^2)"""
+        time_active = np.zeros((self.GRID_SIZE,)*2, dtype=np.uint16)
+        time_active.flat[list(self.activations)] = list(self.activations.values())
+        return time_active
+
+    def get_total(self):
+        """Gets total energy across the entire lattice, -J/2 * sum(spin * field). An inactive cell with no active
+        neighbour has spin * field equal to its neighbour weight, so only the active cells and those within the
+        kernel's reach of them are visited"""
+        cells = np.fromiter(self.active, dtype=np.int64, count=len(self.active))
+        rows, cols = np.divmod(cells, self.GRID_SIZE)
+        near = [cells]
+        for di in range(-self.coupling.radius, self.coupling.radius + 1):
+            for dj in range(-self.coupling.radius, self.coupling.radius + 1):
+                neighbours, valid = self.coupling.neighbour_cells(rows, cols, di, dj)
+                near.append(neighbours[valid])
+        near = np.unique(np.concatenate(near))
+        field, weight = self.fields(near)
+        total = self.coupling.total_weight() + np.sum(np.where(self.is_active(near), field, -field) - weight)
+        return -self.J * float(total) / 2
+
+    def get_magnetisation(self):
+        """Gets the mean spin across the entire lattice (+1 all active, -1 all inactive)"""
+        return (2 * len(self.active) - self.GRID_SIZE**2) / self.GRID_SIZE**2
+
+    def get_active_fraction(self):
+        """Gets the fraction of cells that are active"""
+        return len(self.active) / self.GRID_SIZE**2
+
+    def field(self, i, j):
+        """Gets the local field of cell (i, j), the weighted sum of its neighbours' spins, and the total weight of its
+        neighbours (the field when all of them are active)"""
+        field = weight = 0
+        for r, c, w in self.coupling.cell_neighbours(i, j):
+            field += w if r * self.GRID_SIZE + c in self.active else -w
+            weight += w
+        return field, weight
+
+    def set(self, coords, val=0, convert_to_grid=False):
+        """Sets the value of a cell, converting coordinates if specified. Flips value by default"""
+        if convert_to_grid:
+            coords = self.grid_coords(coords)
+        cell = int(coords[0]) * self.GRID_SIZE + int(coords[1])
+        if val == 1 or (not val and cell not in self.active):
+            self.active.add(cell)
+            self.record["activity"] += 1
+        else:
+            self.active.discard(cell)
+
+    def get(self, coords, convert_to_grid=False):
+        """Gets the spin value for the cell at the given coordinates, converting if specified"""
+        if convert_to_grid:
+            coords = self.grid_coords(coords)
+        return 1 if int(coords[0]) * self.GRID_SIZE + int(coords[1]) in self.active else -1
+
+    def get_activation(self, coords, convert_to_grid=False):
+        """Gets the activity counter for an individual, converting coordinates if specified"""
+        if convert_to_grid:
+            coords = self.grid_coords(coords)
+        return self.activations.get(int(coords[0]) * self.GRID_SIZE + int(coords[1]), 0)
+
+    def set_activation(self, coords, val, convert_to_grid=False):
+        """Sets the activity counter of an individual, converting coordinates if specified"""
+        if convert_to_grid:
+            coords = self.grid_coords(coords)
+        cell = int(coords[0]) * self.GRID_SIZE + int(coords[1])
+        if val:
+            self.activations[cell] = int(val)
+        else:
+            self.activations.pop(cell, None)
+
+    def is_active(self, cells):
+        """Checks which of the given flat cell ids (row*size + column) are active"""
+        return np.fromiter((cell in self.active for cell in cells.tolist()), dtype=bool, count=len(cells))
+
+    def activate(self, cells):
+        """Sets the given flat cell ids active (their activity counters are left as they are)"""
+        self.active.update(cells.tolist())
+
+    def flip(self, cell=None):
+        """Population.flip, skipping picks off the active front (inactive, zero counter, no active neighbour)"""
+        if cell is None:
+            cell = self.cell_picks.next()
+        i, j = int(cell[0]), int(cell[1])
+        if (i * self.GRID_SIZE + j not in self.active and i * self.GRID_SIZE + j not in self.activations
+                and not any(r * self.GRID_SIZE + c in self.active for r, c, _ in self.coupling.cell_neighbours(i, j))):
+            if self.stats is not None:
+                self.stats.count("flips_rejected")
+            return
+        super().flip(cell)
+
+
+def spawn_seeds(seed, n):
+    """Spawns n independent integer seeds (63-bit, so they store anywhere) from a root seed via SeedSequence"""
+    return [int(child.generate_state(1, np.uint64)[0] >> 1) for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+def simulate(params, steps=None, halt_condition="half_herbivores", time_step=None, observers=(), stats=None,
+             fork=None, checkpoint=None, checkpoint_every=None):
+    """Headless simulation main: runs a Population built from params until halted or steps have been taken.
+    stats (an instrumentation.Stats) profiles the run, and writes a last JSON line at the end if it has an out.
+    With fork, the run starts from that checkpoint's lattice and herbivores (Population.fork) instead of afresh.
+    With checkpoint, the state is saved there every checkpoint_every steps and at the end, and a run whose
+    checkpoint already exists resumes from it (which must have been saved with the same params)"""
+    if steps is None and halt_condition is None:
+        raise ValueError("simulate needs a step count, a halting condition, or both")
+    if checkpoint is not None and os.path.exists(checkpoint):
+        sim = Population.load(checkpoint)
+        changed = [f"{name}={sim.params.get(name)!r} (not {value!r})" for name, value in params.items() if sim.params.get(name) != value]
+        if changed:
+            raise ValueError(f"checkpoint {checkpoint} was saved with {', '.join(changed)}")
+    elif fork is not None:
+        sim = Population.fork(fork, **params)
+    else:
+        sim = Population(**params)
+    if steps is None and not sim.haltable(halt_condition):
+        raise ValueError(f"halt_condition {halt_condition!r} can never be met here, so simulate needs a step count")
+    if checkpoint is not None and checkpoint_every:
+        sim.observers.append(Checkpointer(checkpoint, checkpoint_every))
+    sim.observers.extend(observers)
+    sim.stats = stats
+    while not sim.halted(halt_condition) and (steps is None or sim.steps < steps):
+        sim.step(sim.CHUNK if steps is None else steps - sim.steps, time_step, halt_condition)
+    sim.record["time"] = round(sim.elapsed / 1000, 1)  # Logical seconds, in place of wall-clock time
+    sim.record["temp"] = sim.temp
+    if checkpoint is not None:
+        sim.save(checkpoint)
+    if stats is not None:
+        stats.emit(sim)
+    return sim
+
+
+if __name__ == "__main__":
+    from render import run
+
+    """All-default population (for reference) -----=====-----"""
+    run(Population())  # This is exactly the same as the defaults written below.
+
+    # run(Population(
+    #     size=10,  # 10
+    #     randomize=False,  # False
+    #     NUM_OF_HERBIVORES=10,  # 10
+    #     HERBIVORE_SPEED=1,  # 1
+    #     BITE_COOLDOWN=1000,  # 1000
+    #     start_temp=3.,  # 3
+    #     GAP_SIZE=0,  # 0
+    #     PUSH_FACTOR=0.01,  # 0.01
+    #     TURN_FACTOR=10,  # 10
+    #     MAX_ACTIVATION=50,  # 50
+    #     ISING_ON=True),  # True
+    #     debug_mode=False,  # False
+    #     halt_condition="half_herbivores"  # half_herbivores
+    #     )
+
+    """Multi-run data generation -----=====-----"""
+    # Example here is for responsiveness ranging from 1.25 to 3.5 at intervals of 0.25, done 5 times for each value
+    # Here, herbivory is set low (half speed, double bite cooldown). The output is named accordingly.
+    # Runs are headless and use logical time, so they go as fast as the CPU allows.
+    # sweep.py does the same over a process pool and can resume an interrupted sweep, e.g.
+    # python sweep.py -p start_temp=1.25:3.5:0.25 -p HERBIVORE_SPEED=0.5 -p BITE_COOLDOWN=2000 -r 5 -o results/5x125-325_timelimit_lowH.csv
+
+    # data = []
+    # iterations = 5
+    # temp_range = np.arange(1.25, 3.5, 0.25)
+    # for i in range(iterations):
+    #     for j, t in enumerate(temp_range):
+    #         sim = simulate(dict(start_temp=t, HERBIVORE_SPEED=0.5, BITE_COOLDOWN=2000), halt_condition="time_limit")
+    #         data.append(sim.record)
+    # data = pd.DataFrame(data)
+    # data.to_csv("results/5x125-325_timelimit_lowH.csv", index=False)
+
+    """Large-field example -----=====-----"""
+    # run(Population(size=20, HERBIVORE_SPEED=1, NUM_OF_HERBIVORES=20, PUSH_FACTOR=0.03, BITE_COOLDOWN=2000))
+
+    """Avoidance example -----=====-----"""
+    # Click on cells near the herbivore to observe the avoidance mechanism clearly
+    # run(Population(HERBIVORE_SPEED=1, NUM_OF_HERBIVORES=1, TURN_FACTOR=0, ISING_ON=False, PUSH_FACTOR=.01, BITE_COOLDOWN=100000))
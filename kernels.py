@@ -0,0 +1,177 @@
+from math import cos, exp, sin, radians
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # Kernels stay importable (as plain Python) and Population falls back to its NumPy path
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+
+@njit(cache=True)
+def fold(index, size, boundary):
+    """Coupling.fold for one index: wraps it (boundary 1, periodic) or mirrors it (2, reflecting) onto the lattice"""
+    if boundary == 1:
+        return index % size
+    period = max(2 * size - 2, 1)
+    index = index % period
+    return index if index < size else period - index
+
+
+@njit(cache=True)
+def next_uniform(uniforms, cursor):
+    """RandomBlocks.next for the compiled kernels: the next uniform, advancing its position in cursor"""
+    cursor[0] += 1
+    return uniforms[cursor[0] - 1]
+
+
+@njit(cache=True)
+def flip(spins, time_active, offsets, weights, boundary, table, max_alignment, beta, MAX_ACTIVATION, counters,
+         uniforms, cell_picks, cursor):
+    """Population.flip for one random cell, counting activity, flips accepted/rejected and forced deactivations.
+    The cell is coupled to the (row, column) offsets with their weights under boundary 0 (open), 1 (periodic) or 2
+    (reflecting). Flip probabilities come from the table for integer weights, else from exp(-beta * alignment)"""
+    size = spins.shape[0]
+    i = cell_picks[cursor[1], 0]
+    j = cell_picks[cursor[1], 1]
+    cursor[1] += 1
+    spin = spins[i, j]
+
+    field = 0.
+    weight = 0.
+    for k in range(offsets.shape[0]):
+        r = i + offsets[k, 0]
+        c = j + offsets[k, 1]
+        if r < 0 or r >= size or c < 0 or c >= size:
+            if boundary == 0:
+                continue
+            r = fold(r, size, boundary)
+            c = fold(c, size, boundary)
+            if r == i and c == j:  # Not its own neighbour
+                continue
+        field += weights[k] * spins[r, c]
+        weight += weights[k]
+    alignment = spin * field  # dE = 2J * alignment
+    p = table[int(alignment) + max_alignment] if table.size else exp(-beta * alignment)
+
+    # Random flip made impossible when every neighbour is aligned (max difference)
+    if alignment < 0 or (alignment < weight and next_uniform(uniforms, cursor) < p):
+        spins[i, j] = -spin
+        counters[2] += 1  # flips accepted
+        if spin == -1:
+            counters[1] += 1  # activity
+    else:
+        counters[3] += 1  # flips rejected
+
+    if spins[i, j] == 1:
+        time_active[i, j] = (time_active[i, j] + 1) % MAX_ACTIVATION
+        if time_active[i, j] == 0:  # Forced to deactivate
+            spins[i, j] = -1
+            counters[5] += 1  # forced deactivations
+    else:
+        time_active[i, j] = 0
+
+
+@njit(cache=True)
+def herbivore(h, spins, h_pos, h_vel, h_cooldown, h_state, counters, uniforms, cursor, time_step, start_x, start_y,
+              pitch, screen_size, periodic, HERBIVORE_SPEED, PUSH_FACTOR, TURN_FACTOR, BITE_COOLDOWN):
+    """Population.herbivory for herbivore h alone (change direction, move, attack), as in the original sequential loop.
+    On a periodic lattice the herbivore sees and moves across the edges instead of being pushed back by them"""
+    lo_x, lo_y = start_x, start_y
+    hi_x, hi_y = start_x + screen_size - 1, start_y + screen_size - 1
+
+    # Random velocity rotation
+    angle = radians(next_uniform(uniforms, cursor)*(2*TURN_FACTOR) - TURN_FACTOR)
+    vx = h_vel[h, 0]*cos(angle) - h_vel[h, 1]*sin(angle)
+    vy = h_vel[h, 0]*sin(angle) + h_vel[h, 1]*cos(angle)
+
+    # Defense-active cells (and the border) nudge velocity away (avoidance)
+    push_x = 0.
+    push_y = 0.
+    for r in range(-1, 2):
+        for c in range(-1, 2):
+            x = h_pos[h, 0] + pitch*c
+            y = h_pos[h, 1] + pitch*r
+            if periodic:
+                x = lo_x + (x - lo_x) % screen_size
+                y = lo_y + (y - lo_y) % screen_size
+            elif not (lo_x < x <= hi_x and lo_y < y <= hi_y):
+                push_x -= c
+                push_y -= r
+                continue
+            if spins[int((y - lo_y)//pitch), int((x - lo_x)//pitch)] != -1:
+                push_x -= c
+                push_y -= r
+    vx += HERBIVORE_SPEED * PUSH_FACTOR * push_x
+    vy += HERBIVORE_SPEED * PUSH_FACTOR * push_y
+
+    # Move according to new adjusted velocity, then out of bounds check
+    x = h_pos[h, 0] + vx * time_step
+    y = h_pos[h, 1] + vy * time_step
+    if periodic:
+        h_pos[h, 0] = lo_x + (x - lo_x) % screen_size
+        h_pos[h, 1] = lo_y + (y - lo_y) % screen_size
+    else:
+        h_pos[h, 0] = min(x, hi_x) if x > lo_x else lo_x + 1.
+        h_pos[h, 1] = min(y, hi_y) if y > lo_y else lo_y + 1.
+
+    speed = (vx*vx + vy*vy) ** 0.5
+    if speed > 0:  # Reset velocity's magnitude
+        vx *= HERBIVORE_SPEED / speed
+        vy *= HERBIVORE_SPEED / speed
+    h_vel[h, 0] = vx
+    h_vel[h, 1] = vy
+
+    # Perform attack based on cooldown
+    if h_cooldown[h] > 0:
+        h_cooldown[h] -= 1
+        return
+    h_cooldown[h] = int(BITE_COOLDOWN * (1 + next_uniform(uniforms, cursor)))  # Ranges from 1x to 2x base cooldown
+    i = int((h_pos[h, 1] - lo_y)//pitch)
+    j = int((h_pos[h, 0] - lo_x)//pitch)
+    if spins[i, j] == 1:  # Attacking active cell
+        h_vel[h, 0] = 0.
+        h_vel[h, 1] = 0.
+        h_state[h] = 0
+        counters[4] += 1  # deaths
+    else:  # Attacking inactive cell
+        spins[i, j] = 1
+        counters[0] += 1  # undefended_attacks
+        counters[1] += 1  # activity
+
+
+@njit(cache=True)
+def run_steps(n, uniforms, cell_picks, cursor, spins, time_active, h_pos, h_vel, h_cooldown, h_state, counters, offsets,
+              weights, boundary, table, max_alignment, beta, elapsed, time_step, ISING_ON, MAX_ACTIVATION, start_x, start_y,
+              pitch, screen_size, HERBIVORE_SPEED, PUSH_FACTOR, TURN_FACTOR, BITE_COOLDOWN, halt_dead, halt_elapsed):
+    """Runs up to n random-sequential steps (one flip, then every herbivore in turn), stopping early once
+    halt_dead herbivores are dead or halt_elapsed ms have passed. counters holds undefended attacks, activity, flips
+    accepted, flips rejected, deaths and forced deactivations. Random numbers are read in order from uniforms and
+    cell_picks (rows of (row, column)) at the positions in cursor, which are advanced, so a run depends only on the
+    draws and not on how it is split into calls. It also stops before a step the blocks might not have enough draws
+    left for. Returns (steps taken, elapsed, whether it stopped for more draws)"""
+    dead = 0
+    for h in range(h_state.shape[0]):
+        if h_state[h] == 0:
+            dead += 1
+
+    for step in range(n):
+        # At most one cell and one uniform for the flip, and a turn angle and bite cooldown per living herbivore
+        if cursor[0] + 1 + 2*(h_state.shape[0] - dead) > uniforms.shape[0] or cursor[1] + 1 > cell_picks.shape[0]:
+            return step, elapsed, True
+        if ISING_ON:
+            flip(spins, time_active, offsets, weights, boundary, table, max_alignment, beta, MAX_ACTIVATION, counters,
+                 uniforms, cell_picks, cursor)
+        for h in range(h_state.shape[0]):
+            if h_state[h]:  # If herbivore is alive
+                herbivore(h, spins, h_pos, h_vel, h_cooldown, h_state, counters, uniforms, cursor, time_step, start_x,
+                          start_y, pitch, screen_size, boundary == 1, HERBIVORE_SPEED, PUSH_FACTOR, TURN_FACTOR,
+                          BITE_COOLDOWN)
+                if h_state[h] == 0:
+                    dead += 1
+        elapsed += time_step
+        if dead >= halt_dead or elapsed >= halt_elapsed:
+            return step + 1, elapsed, False
+    return n, elapsed, False
@@ -0,0 +1,60 @@
+import json
+import numpy as np
+
+COLUMNS = {  # Sampled quantities and their dtypes
+    "step": np.int64,
+    "time": np.float64,  # Logical milliseconds
+    "magnetisation": np.float64,
+    "energy": np.float64,  # Population.get_total()
+    "active_fraction": np.float64,
+    "live_herbivores": np.int64,
+    "undefended_attacks": np.int64,  # Cumulative, as in Population.record
+    "activity": np.int64  # Cumulative, as in Population.record
+}
+
+
+class Recorder:
+    """Population observer that samples a time series every few steps into preallocated NumPy buffers"""
+
+    def __init__(self, every=100, capacity=1024):
+        self.every = every  # Steps between samples
+        self.buffers = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.length = 0
+
+    def __call__(self, sim):
+        """Observer hook: samples the population when the step count is a multiple of every"""
+        if not sim.steps % self.every:
+            self.sample(sim)
+
+    def sample(self, sim):
+        """Writes the current state of the population into the next row of the buffers"""
+        if self.length == len(self.buffers["step"]):  # Full, so double the capacity
+            for name, buffer in self.buffers.items():
+                self.buffers[name] = np.concatenate((buffer, np.empty_like(buffer)))
+        row = {
+            "step": sim.steps,
+            "time": sim.elapsed,
+            "magnetisation": sim.get_magnetisation(),
+            "energy": sim.get_total(),
+            "active_fraction": sim.get_active_fraction(),
+            "live_herbivores": np.count_nonzero(sim.h_state),
+            "undefended_attacks": sim.record["undefended_attacks"],
+            "activity": sim.record["activity"]
+        }
+        for name, value in row.items():
+            self.buffers[name][self.length] = value
+        self.length += 1
+
+    def columns(self):
+        """Gets the recorded samples as {name: array}"""
+        return {name: buffer[:self.length] for name, buffer in self.buffers.items()}
+
+    def save(self, path, **metadata):
+        """Writes the samples to a compressed .npz file, with any run metadata (parameters, seed, record) as JSON"""
+        np.savez_compressed(path, metadata=json.dumps(metadata, default=str), **self.columns())
+
+
+def load(path):
+    """Reads a file written by Recorder.save, returning ({name: array}, metadata)"""
+    with np.load(path) as data:
+        return {name: data[name] for name in COLUMNS}, json.loads(str(data["metadata"]))
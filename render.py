@@ -0,0 +1,139 @@
+import time
+import numpy as np
+import pygame as pg
+
+
+class Renderer:
+    """Pygame view of a Population. Attached as an observer, it handles input and redraws every `every` steps.
+    The lattice is kept on a cached surface where only changed cells are redrawn, and only dirty rects are updated"""
+
+    def __init__(self, sim, debug_mode=False, iteration="", steps_per_frame=1):
+        # Pygame initialization (graphics)
+        pg.init()
+        pg.display.set_caption(f"Ising Simulation {iteration}")
+        self.debug = debug_mode
+        self.every = steps_per_frame  # Physics steps per rendered frame
+        self.clock = pg.time.Clock()
+        self.running = True
+        self.screen = pg.display.set_mode((sim.SCREEN_SIZE + sim.START_LOC[0], sim.SCREEN_SIZE + sim.START_LOC[1]))
+        self.text = pg.font.SysFont("moderno20", sim.START_LOC[0])
+
+        # Lattice as last drawn, on a surface the size of the window (the thermostat column stays black)
+        self.lattice = pg.Surface(self.screen.get_size())
+        self.lattice.fill("black")
+        # Taken once, since a sparse population builds its dense arrays on every access
+        self.drawn_spins = sim.spins.copy()
+        self.drawn_activation = sim.time_active.copy()
+        for i, j in np.ndindex(self.drawn_spins.shape):
+            self.draw_cell(sim, i, j, self.drawn_spins, self.drawn_activation)
+        self.screen.blit(self.lattice, (0, 0))
+        pg.display.flip()
+        self.overlays = []  # Rects covered by herbivores and text last frame, restored from the lattice surface
+
+    def __call__(self, sim):
+        """Observer hook: once every `every` steps, processes events and clicks, then draws what has changed"""
+        if sim.steps % self.every:
+            return
+        stats = sim.stats  # Input, drawing and display are timed when profiling
+        if stats is not None:
+            stats.mark()
+        for event in pg.event.get():
+            # Exits on closing 'X' click
+            if event.type == pg.QUIT:
+                self.running = False
+
+        # Checks for clicks (and counts cooldown)
+        if sim.click_cooldown:
+            sim.click_cooldown -= 1
+        button_clicks = pg.mouse.get_pressed()
+        if button_clicks[0]:
+            sim.click(np.array(pg.mouse.get_pos()))
+        if button_clicks[2]:
+            sim.right_click(np.array(pg.mouse.get_pos()))
+        if stats is not None:
+            stats.lap("input")
+
+        # Uncover last frame's herbivores and text -> redraw changed cells -> options (thermostat) -> herbivores
+        dirty = list(self.overlays)
+        for rect in self.overlays:
+            self.screen.blit(self.lattice, rect, rect)
+        dirty += self.draw_grid(sim)
+        dirty.append(self.draw_options(sim))
+        self.overlays = self.draw_herbivores(sim)
+
+        # Draw text display(s)
+        self.overlays.append(self.screen.blit(self.text.render(str(round(sim.temp, 1)), False, "white"), (0, 0)))
+        if self.debug and sim.info is not None:
+            self.overlays.append(self.screen.blit(self.text.render(str(sim.info), False, "white"), sim.START_LOC))
+
+        if stats is not None:
+            stats.lap("draw")
+        pg.display.update(dirty + self.overlays)  # Redraws only the dirty parts of the screen
+        if stats is not None:
+            stats.lap("display")
+
+    def draw_cell(self, sim, i, j, spins, time_active):
+        """Draws one lattice cell, given the lattice and activation arrays, onto the cached lattice surface"""
+        rect = pg.Rect(sim.cell_rect(i, j))
+        pg.draw.rect(self.lattice, sim.COLOURS[spins[i, j]], rect)
+        if self.debug:
+            pg.draw.rect(self.lattice, (0, 255*time_active[i, j]/sim.MAX_ACTIVATION, 0), pg.Rect(
+                    rect[0],
+                    rect[1],
+                    max(1, sim.CELL_SIZE/10),
+                    max(1, sim.CELL_SIZE/10)))
+        return rect
+
+    def draw_grid(self, sim):
+        """Redraws the cells that changed since the last frame, returning their rects"""
+        spins = sim.spins  # Once per frame, as in __init__ (activations are only drawn in debug mode)
+        time_active = sim.time_active if self.debug else None
+        changed = spins != self.drawn_spins
+        if self.debug:
+            changed |= time_active != self.drawn_activation
+            self.drawn_activation[changed] = time_active[changed]
+        self.drawn_spins[changed] = spins[changed]
+        rects = []
+        for i, j in np.argwhere(changed):
+            rect = self.draw_cell(sim, i, j, spins, time_active)
+            self.screen.blit(self.lattice, rect, rect)
+            rects.append(rect)
+        return rects
+
+    def draw_options(self, sim):
+        """Draws thermostat, and other future options if added"""
+        column = pg.Rect(0, 0, sim.START_LOC[0], self.screen.get_height())
+        self.screen.fill("black", column)
+        pg.draw.circle(self.screen, "green", sim.thermo_pos, sim.START_LOC[0]//3)
+        return column
+
+    def draw_herbivores(self, sim):
+        """Draws every herbivore, returning the rects they cover"""
+        radius = max(sim.CELL_SIZE/5, 1)
+        return [pg.draw.circle(self.screen, ("black", "white")[state], p, radius) for p, state in zip(sim.h_pos, sim.h_state)]
+
+
+def run(sim, debug_mode=False, iteration="", halt_condition="half_herbivores", steps_per_frame=1):
+    """Interactive simulation main: steps with a Renderer attached. With one step per frame each step lasts the
+    wall-clock frame time, as originally; with more, steps take the logical TIME_STEP and play faster than real time"""
+    renderer = Renderer(sim, debug_mode, iteration, steps_per_frame)
+    sim.observers.append(renderer)
+    start = time.time()
+
+    # Game (simulation) loop
+    while renderer.running:
+        dt = renderer.clock.tick()  # Dynamic time interval for constant herbivore speeds
+        sim.step(steps_per_frame, time_step=dt if steps_per_frame == 1 else None, halt_condition=halt_condition)
+
+        match halt_condition:
+            case "half_herbivores":
+                if sim.halted(halt_condition):
+                    sim.record["time"] = round(time.time() - start, 1)
+                    sim.record["temp"] = sim.temp
+                    renderer.running = False
+
+            case "time_limit":  # Logical time, which is the frame time at one step per frame
+                if sim.halted(halt_condition):
+                    renderer.running = False
+
+    sim.observers.remove(renderer)
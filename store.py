@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import pandas as pd
+import isingsim
+
+RECORD_COLUMNS = ["time", "undefended_attacks", "activity", "temp"]  # Keys of Population.record
+RUN_COLUMNS = ["halt_condition", "steps", "fork", "replicate", "seed"]  # How a run was made, besides its parameters
+PARAMETERS = {name: parameter.default for name, parameter in inspect.signature(isingsim.Population.__init__).parameters.items()
+              if name not in ("self", "seed")}  # Population parameters and their defaults
+LEGACY = {  # Hand-named time-limited multi-runs (start_temp 1.25 to 3.25, 5 replicates) and the herbivory level of each
+    "results/5x125-325_timelimit_lowH.csv": dict(HERBIVORE_SPEED=0.5, BITE_COOLDOWN=2000),  # Low: half speed, double cooldown
+    "results/5x125-325_timelimit.csv": {},  # Medium: defaults
+    "results/5x125-325_timelimit_highH.csv": dict(HERBIVORE_SPEED=2., BITE_COOLDOWN=500)  # High: double speed, half cooldown
+}
+
+
+def run_id(row, seeded=True):
+    """Identifies a run by its full parameter set (defaults filled in), halting condition, step limit, fork checkpoint
+    (only for forked runs), replicate and seed (or, unseeded, just its parameter point and replicate). Numeric
+    parameters are compared as floats, so 1 and 1.0 are the same run"""
+    params = {name: row.get(name, default) for name, default in PARAMETERS.items()}
+    params = {name: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+              for name, value in params.items()}
+    run = {name: row.get(name) for name in RUN_COLUMNS
+           if (seeded or name != "seed") and (name != "fork" or row.get("fork") is not None)}
+    return json.dumps({**params, **run}, sort_keys=True, default=str)
+
+
+def pinned(**predicates):
+    """Predicates for the runs of one parameter point: every parameter not given at its default (but start_temp,
+    which sweeps vary and hand-named runs take from temp), no step limit and no fork, e.g. pinned(HERBIVORE_SPEED=0.5)"""
+    return {**{name: default for name, default in PARAMETERS.items() if name != "start_temp"}, "steps": None, "fork": None,
+            **predicates}
+
+
+def checkpoint_id(path):
+    """Identifies a checkpoint (e.g. one a sweep forks from) by a hash of its contents, wherever it is kept"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+class ResultsStore:
+    """SQLite store of run results (one row per run: every Population parameter, how the run was made, and its
+    record), keyed by run_id. The database is in WAL mode, so sweep workers in several processes can append at once
+    while it is read, and loads filter in SQL through indexed columns rather than reading every row"""
+
+    def __init__(self, path="results/runs.sqlite"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.columns = list(PARAMETERS) + RUN_COLUMNS + RECORD_COLUMNS
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, point TEXT, {', '.join(map(quote, self.columns))})")
+            # Parameters added to Population since the table was made: earlier runs used their defaults
+            existing = {row[1] for row in db.execute("PRAGMA table_info(runs)")}
+            for name, default in PARAMETERS.items():
+                if name not in existing:
+                    db.execute(f"ALTER TABLE runs ADD COLUMN {quote(name)} DEFAULT {sql_literal(default)}")
+            for name in RUN_COLUMNS:  # Likewise, earlier runs were not forked
+                if name not in existing:
+                    db.execute(f"ALTER TABLE runs ADD COLUMN {quote(name)}")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_herbivory ON runs (HERBIVORE_SPEED, BITE_COOLDOWN, temp)")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_temp ON runs (temp)")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_point ON runs (point)")
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Opens a connection that waits for other writers, committing and closing it afterwards"""
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    def append(self, rows):
+        """Adds runs (dicts of parameters, run columns and record; missing parameters are defaults), skipping any
+        already stored. Returns the number added"""
+        values = []
+        for row in rows:
+            row = {**PARAMETERS, **row}
+            values.append([run_id(row), run_id(row, seeded=False)] + [row.get(name) for name in self.columns])
+        with self.connect() as db:
+            before = db.total_changes
+            db.executemany(f"INSERT OR IGNORE INTO runs (id, point, {', '.join(map(quote, self.columns))}) "
+                           f"VALUES ({', '.join('?' * (len(self.columns) + 2))})", values)
+            return db.total_changes - before
+
+    def points(self):
+        """Gets the unseeded run_id of every stored run, so a restarted sweep can skip runs whatever their seeds"""
+        with self.connect() as db:
+            return {row[0] for row in db.execute("SELECT point FROM runs")}
+
+    def where(self, predicates):
+        """Builds an SQL condition from column=value predicates: a (low, high) tuple is an inclusive range, a list or
+        set is a choice of values and None matches missing values"""
+        clauses, values = [], []
+        for name, value in predicates.items():
+            if name not in self.columns:
+                raise ValueError(f"{name!r} is not a stored column")
+            if isinstance(value, tuple):
+                clauses.append(f"{quote(name)} BETWEEN ? AND ?")
+                values += list(value)
+            elif isinstance(value, (list, set, frozenset)):
+                clauses.append(f"{quote(name)} IN ({', '.join('?' * len(value))})")
+                values += list(value)
+            elif value is None:
+                clauses.append(f"{quote(name)} IS NULL")
+            else:
+                clauses.append(f"{quote(name)} = ?")
+                values.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
+
+    def load(self, columns=None, **predicates):
+        """Loads the matching runs as a DataFrame, e.g. load(HERBIVORE_SPEED=0.5, temp=(1.5, 3)).
+        Only the given columns are read (default all)"""
+        where, values = self.where(predicates)
+        selected = ", ".join(quote(name) for name in (columns or self.columns))
+        with self.connect() as db:
+            return pd.read_sql_query(f"SELECT {selected} FROM runs{where}", db, params=values)
+
+    def count(self, **predicates):
+        """Counts the matching runs"""
+        where, values = self.where(predicates)
+        with self.connect() as db:
+            return db.execute(f"SELECT COUNT(*) FROM runs{where}", values).fetchone()[0]
+
+    def import_csv(self, path, halt_condition=None, steps=None, chunksize=100000, **params):
+        """Adds the runs of a csv (a sweep.py output or a hand-named multi-run), read in chunks. Parameters are
+        taken from the csv's columns, then params, then defaults; start_temp defaults to the recorded temp. Without a
+        replicate column, runs of the same parameters are numbered in file order. Returns the number added"""
+        added = 0
+        seen = {}  # Parameter values -> runs so far, for numbering replicates across chunks
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            rows = []
+            for row in chunk.to_dict("records"):
+                row = {"start_temp": row["temp"], "halt_condition": halt_condition, "steps": steps, **params,
+                       **{name: value for name, value in row.items() if not pd.isna(value)}}
+                if "replicate" not in row:
+                    point = run_id({**row, "replicate": None}, seeded=False)
+                    row["replicate"] = seen.get(point, 0)
+                    seen[point] = row["replicate"] + 1
+                rows.append(row)
+            added += self.append(rows)
+        return added
+
+    def import_legacy(self):
+        """Imports the hand-named multi-runs in LEGACY (those that exist and have no runs in the store yet) with their
+        herbivory parameters"""
+        return sum(self.import_csv(path, halt_condition="time_limit", **params) for path, params in LEGACY.items()
+                   if os.path.exists(path) and not self.count(**pinned(**params, halt_condition="time_limit", seed=None)))
+
+
+def quote(name):
+    """Quotes a column name for SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_literal(value):
+    """Writes a parameter default as an SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(int(value) if isinstance(value, bool) else value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports csv results into the SQLite results store")
+    parser.add_argument("csv", nargs="*", help="sweep.py or multi-run csv files to import")
+    parser.add_argument("--db", default="results/runs.sqlite", help="Results store (default results/runs.sqlite)")
+    parser.add_argument("--legacy", action="store_true", help="Import the hand-named multi-runs with their herbivory levels")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="Parameter value the csv runs were made with, e.g. HERBIVORE_SPEED=0.5")
+    parser.add_argument("--halt", default=None, help="Halting condition the csv runs were made with")
+    parser.add_argument("--steps", type=int, default=None, help="Step limit the csv runs were made with")
+    args = parser.parse_args()
+
+    from sweep import parse_values
+    params = {}
+    for param in args.param:
+        name, value = param.split("=", 1)
+        params[name] = parse_values(value)[0]
+    store = ResultsStore(args.db)
+    added = store.import_legacy() if args.legacy else 0
+    for path in args.csv:
+        added += store.import_csv(path, args.halt, args.steps, **params)
+    print(f"Added {added} runs, {store.count()} in {args.db}")
@@ -0,0 +1,166 @@
+import argparse
+import ast
+import contextlib
+import csv
+import hashlib
+import inspect
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import isingsim
+from recorder import Recorder
+from instrumentation import Stats
+from store import ResultsStore, checkpoint_id, run_id
+
+RECORD_COLUMNS = ["time", "undefended_attacks", "activity", "temp"]  # Keys of Population.record
+RUN_COLUMNS = ["halt_condition", "steps", "fork"]  # How every run of a sweep is made, besides its parameters
+
+
+def parameter_grid(grid):
+    """Expands {parameter: [values]} into every combination of parameter values, one dict per point"""
+    names = list(grid)
+    for name in names:
+        if name not in inspect.signature(isingsim.Population.__init__).parameters:
+            raise ValueError(f"{name!r} is not a Population parameter")
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_key(params, replicate):
+    """Identifies a run by its parameter values (and RUN_COLUMNS) and replicate, in the form they are written to (and
+    read from) csv"""
+    return tuple("" if params[name] is None else str(params[name]) for name in sorted(params)) + (str(replicate),)
+
+
+def completed_runs(path, columns):
+    """Collects the keys of runs already written to a sweep output, so a restarted sweep can skip them. The output
+    must have the columns of this sweep"""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return set()
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != columns:
+            raise ValueError(f"{path} holds another sweep's runs (columns {reader.fieldnames}), not {columns}")
+        names = [name for name in reader.fieldnames if name not in RECORD_COLUMNS + ["replicate", "seed"]]
+        return {run_key({name: row[name] for name in names}, row["replicate"]) for row in reader}
+
+
+def run_name(params, replicate, seed, options):
+    """Names a run's own files (checkpoint, trajectory, profile) by a hash of its run_id, so sweeps sharing a
+    directory never pick up or overwrite each other's files"""
+    row = {**params, **options["run"], "replicate": replicate, "seed": seed}
+    return hashlib.sha1(run_id(row).encode()).hexdigest()[:16]
+
+
+def run_task(task):
+    """Worker: runs one headless simulation with its own seed and returns the output row"""
+    params, replicate, seed, options = task
+    trajectories, stats, checkpoints = options["trajectories"], options["stats"], options["checkpoints"]
+    observers = [Recorder(options["record_every"])] if trajectories else []
+    name = run_name(params, replicate, seed, options)
+    # Profiling summaries go to their own files, named by the run
+    stats = Stats(os.path.join(stats, f"{name}.jsonl"), options["stats_every"]) if stats else None
+    checkpoint = os.path.join(checkpoints, f"{name}.npz") if checkpoints else None
+    sim = isingsim.simulate({**params, "seed": seed}, steps=options["steps"], halt_condition=options["halt_condition"],
+                            observers=observers, stats=stats, fork=options["fork"], checkpoint=checkpoint,
+                            checkpoint_every=options["checkpoint_every"])
+    if trajectories:  # Time series go to their own file, named by the run
+        observers[0].save(os.path.join(trajectories, f"{name}.npz"), params=params, replicate=replicate, seed=seed, record=sim.record)
+    row = {**params, **options["run"], "replicate": replicate, "seed": seed, **sim.record}
+    if options["store"]:  # Workers append to the store themselves
+        ResultsStore(options["store"]).append([row])
+    return row
+
+
+def run_sweep(grid, replicates=5, out="results/sweep.csv", steps=None, halt_condition="time_limit", processes=None, seed=0,
+              trajectories=None, record_every=100, stats=None, stats_every=None, fork=None, checkpoints=None,
+              checkpoint_every=None, store=None):
+    """Runs every grid point `replicates` times over a process pool, appending each finished run to the out csv.
+    If trajectories is a directory, each run's time series (sampled every record_every steps) is saved there too.
+    If stats is a directory, each run is profiled and its instrumentation.Stats JSON lines (one every stats_every
+    steps, and one at the end) are written there.
+    With fork (a checkpoint, e.g. of an equilibrated lattice), every run starts from its state with its own parameters.
+    If checkpoints is a directory, each run saves its state there every checkpoint_every steps, and an unfinished run
+    resumes from its checkpoint when the sweep is restarted.
+    With store (a store.ResultsStore path), runs are appended there by the workers instead of to the out csv, and the
+    runs already in the store are skipped"""
+    points = parameter_grid(grid)
+    tasks = [(params, replicate) for replicate in range(replicates) for params in points]
+    # Seeds are spawned for the full task list so that a task keeps its seed when the sweep is restarted
+    seeds = isingsim.spawn_seeds(seed, len(tasks))
+    # Forked runs are told apart by their checkpoint's contents, whatever its path
+    run = dict(halt_condition=halt_condition, steps=steps, fork=checkpoint_id(fork) if fork else None)
+    columns = list(grid) + RUN_COLUMNS + ["replicate", "seed"] + RECORD_COLUMNS
+    if store:
+        stored = ResultsStore(store).points()
+        done = {run_key({**params, **run}, replicate) for params, replicate in tasks
+                if run_id({**params, **run, "replicate": replicate}, seeded=False) in stored}
+    else:
+        done = completed_runs(out, columns)
+    for directory in (trajectories, stats, checkpoints):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    options = dict(steps=steps, halt_condition=halt_condition, trajectories=trajectories, record_every=record_every,
+                   stats=stats, stats_every=stats_every, fork=fork, checkpoints=checkpoints, checkpoint_every=checkpoint_every,
+                   store=store, run=run)
+    todo = [(params, replicate, task_seed, options)
+            for (params, replicate), task_seed in zip(tasks, seeds) if run_key({**params, **run}, replicate) not in done]
+    print(f"{len(tasks) - len(todo)}/{len(tasks)} runs already in {store or out}, running {len(todo)}")
+
+    write_header = not store and (not os.path.exists(out) or not os.path.getsize(out))
+    with (contextlib.nullcontext() if store else open(out, "a", newline="")) as f, ProcessPoolExecutor(processes) as pool:
+        writer = csv.DictWriter(f, columns) if f else None
+        if write_header:
+            writer.writeheader()
+        futures = [pool.submit(run_task, task) for task in todo]
+        for i, future in enumerate(as_completed(futures)):
+            row = future.result()
+            if writer:
+                writer.writerow(row)
+                f.flush()  # Each finished run is on disk before the next one is waited for
+            print(f"{len(tasks) - len(todo) + i + 1}/{len(tasks)}", end="\r")
+    print()
+
+
+def parse_values(text):
+    """Parses "start:stop:step" (stop excluded, as np.arange) or "a,b,c" into a list of values"""
+    if text.count(":") == 2:
+        start, stop, step = (float(x) for x in text.split(":"))
+        return [round(x, 10) for x in np.arange(start, stop, step).tolist()]
+    values = []
+    for value in text.split(","):
+        try:
+            values.append(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            values.append(value)  # Plain strings (e.g. update_scheme=metropolis)
+    return values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel, resumable parameter sweep over headless Population runs")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUES",
+                        help='Population parameter and its values, e.g. start_temp=1.25:3.5:0.25 or HERBIVORE_SPEED=0.5,1,2')
+    parser.add_argument("-r", "--replicates", type=int, default=5, help="Runs per parameter point (default 5)")
+    parser.add_argument("-o", "--out", default="results/sweep.csv", help="Output csv, appended to and resumed from")
+    parser.add_argument("--steps", type=int, default=None, help="Maximum number of steps per run")
+    parser.add_argument("--halt", default="time_limit", help='Halting condition, "time_limit", "half_herbivores" or "none"')
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="Root seed the per-run seeds are spawned from")
+    parser.add_argument("--trajectories", default=None, metavar="DIR", help="Also save each run's time series (npz) here")
+    parser.add_argument("--record-every", type=int, default=100, help="Steps between time series samples (default 100)")
+    parser.add_argument("--stats", default=None, metavar="DIR", help="Also profile each run, writing JSON lines here")
+    parser.add_argument("--stats-every", type=int, default=None, help="Steps between profiling lines (default: end only)")
+    parser.add_argument("--fork", default=None, metavar="CHECKPOINT", help="Start every run from this checkpoint's state")
+    parser.add_argument("--checkpoints", default=None, metavar="DIR", help="Checkpoint each run here, resuming unfinished ones")
+    parser.add_argument("--checkpoint-every", type=int, default=None, help="Steps between checkpoints (default: end only)")
+    parser.add_argument("--store", default=None, metavar="DB", help="Append runs to this results store instead of the csv")
+    args = parser.parse_args()
+
+    grid = {}
+    for param in args.param:
+        name, values = param.split("=", 1)
+        grid[name] = parse_values(values)
+    halt_condition = None if args.halt == "none" else args.halt
+    run_sweep(grid, args.replicates, args.out, args.steps, halt_condition, args.processes, args.seed,
+              args.trajectories, args.record_every, args.stats, args.stats_every, args.fork, args.checkpoints,
+              args.checkpoint_every, args.store)
@@ -0,0 +1,74 @@
+"""Checks that seeded runs agree exactly across the engine's paths. Run with python -m pytest"""
+import pytest
+import isingsim
+import kernels
+from recorder import Recorder
+
+PARAMS = dict(size=16, NUM_OF_HERBIVORES=20, randomize=True, seed=5, start_temp=2.0, BITE_COOLDOWN=200)
+DEFAULT_RULES = {  # Undefended attacks, activity, lattice sum and living herbivores after 400 steps of PARAMS
+    "random": (13, 118, -16, 13),
+    "metropolis": (20, 659, -254, 20),
+    "heat_bath": (20, 498, -254, 20),
+    "swendsen_wang": (9, 25226, 144, 9),
+    "wolff": (12, 26488, -188, 12),
+}
+BACKENDS = ["numpy", pytest.param("numba", marks=pytest.mark.skipif(not kernels.NUMBA_AVAILABLE, reason="needs numba"))]
+
+
+def state(sim):
+    """Everything a seeded run must reproduce: lattice, activations, herbivores and counters"""
+    return (sim.spins.tolist(), sim.time_active.tolist(), sim.h_pos.tolist(), sim.h_vel.tolist(), sim.h_state.tolist(),
+            sim.record["undefended_attacks"], sim.record["activity"], sim.steps, sim.elapsed)
+
+
+@pytest.mark.parametrize("scheme", DEFAULT_RULES)
+def test_default_rules_unchanged(scheme):
+    sim = isingsim.Population(**PARAMS, update_scheme=scheme, backend="numpy")
+    sim.step(400)
+    result = (sim.record["undefended_attacks"], sim.record["activity"], int(sim.spins.sum()), int(sim.h_state.sum()))
+    assert result == DEFAULT_RULES[scheme]
+
+
+def test_explicit_defaults_match_implicit():
+    implicit = isingsim.Population(**PARAMS, backend="numpy")
+    explicit = isingsim.Population(**PARAMS, backend="numpy", boundary="open", neighbourhood="von_neumann", signal_range=1)
+    implicit.step(400)
+    explicit.step(400)
+    assert state(implicit) == state(explicit)
+
+
+def test_sparse_matches_dense():
+    dense = isingsim.Population(**PARAMS, backend="numpy")
+    sparse = isingsim.Population(**PARAMS, backend="numpy", sparse=True)
+    dense.step(2000)
+    sparse.step(2000)
+    assert state(sparse) == state(dense)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("sparse", [False, True])
+def test_checkpoint_resumes_exactly(tmp_path, backend, sparse):
+    if sparse and backend == "numba":
+        pytest.skip("sparse mode runs on the numpy backend only")
+    straight = isingsim.Population(**PARAMS, backend=backend, sparse=sparse)
+    straight.step(1000)
+    saved = isingsim.Population(**PARAMS, backend=backend, sparse=sparse)
+    saved.step(400)
+    saved.save(str(tmp_path / "run.npz"))
+    resumed = isingsim.Population.load(str(tmp_path / "run.npz"))
+    resumed.step(600)
+    assert state(resumed) == state(straight)
+
+
+@pytest.mark.skipif(not kernels.NUMBA_AVAILABLE, reason="needs numba")
+def test_compiled_runs_do_not_depend_on_chunking():
+    straight = isingsim.Population(**PARAMS, backend="numba")
+    straight.step(3000)
+    chunked = isingsim.Population(**PARAMS, backend="numba")
+    for n in (1, 7, 300, 1692, 1000):
+        chunked.step(n)
+    observed = isingsim.Population(**PARAMS, backend="numba")
+    observed.observers.append(Recorder(every=100))
+    observed.step(3000)
+    assert state(chunked) == state(straight)
+    assert state(observed) == state(straight)